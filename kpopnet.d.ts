@@ -40,9 +40,17 @@ export interface Group {
   parent_id: string | null;
 }
 
+// Resized copies of every thumbnail, available at thumb_url with ".jpg"
+// replaced by `.${size}.${format}`
+export interface ThumbVariants {
+  sizes: number[];
+  formats: string[];
+}
+
 export interface Profiles {
   groups: Group[];
   idols: Idol[];
+  thumb_variants?: ThumbVariants;
 }
 
 declare const profiles: Profiles;
@@ -1,11 +1,203 @@
 #!/usr/bin/env pipenv run python
 
+# NOTE: keep imports lazy, offline commands shouldn't pay for Scrapy startup
+
 import sys
+import json
 import argparse
+from pathlib import Path
+
+from kpopnet.utils import parse_shard
+
+DEFAULT_FPATH = Path(__file__).parent / "kpopnet.json"
+
+
+def run_kastden(args, **kwargs) -> bool:
+    """Run kastden spider, return True on error."""
+    from scrapy import signals
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    from kpopnet.extensions import CrawlMetrics
+
+    def process_spider_error(failure, response, spider):
+        nonlocal had_error
+        had_error = True
+
+    def process_spider_closed(spider, reason):
+        nonlocal had_error
+        if reason != "finished":
+            had_error = True
+
+    had_error = False
+
+    settings = get_project_settings()
+    if args.incremental:
+        # revalidate cached pages instead of trusting them forever
+        settings.set("HTTPCACHE_POLICY", "scrapy.extensions.httpcache.RFC2616Policy")
+        settings.set("HTTPCACHE_ALWAYS_STORE", True)
+    if args.offline:
+        # never touch the network, missing pages are ignored and reported
+        settings.set("HTTPCACHE_ENABLED", True)
+        settings.set("HTTPCACHE_IGNORE_MISSING", True)
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler("kastden")
+    crawler.signals.connect(process_spider_error, signals.spider_error)
+    crawler.signals.connect(process_spider_closed, signals.spider_closed)
+    process.crawl(
+        crawler, incremental=args.incremental, offline=args.offline, **kwargs
+    )
+    process.start()
+
+    metrics = next(
+        (m for m in crawler.extensions.middlewares if isinstance(m, CrawlMetrics)),
+        None,
+    )
+    if metrics:
+        print(metrics.summary(), file=sys.stderr)
+
+    # XXX(Kagami): hackish way to catch exception in closed()
+    if crawler.stats and crawler.stats.get_value("log_count/ERROR", 0) != 0:
+        had_error = True
 
-from scrapy import signals
-from scrapy.crawler import CrawlerProcess
-from scrapy.utils.project import get_project_settings
+    return had_error
+
+
+def run_shards(args) -> bool:
+    """Crawl every shard in its own process, return True on error."""
+    import subprocess
+
+    cmd = [sys.executable, sys.argv[0], "kastden"]
+    if args.incremental:
+        cmd.append("--incremental")
+    if args.offline:
+        cmd.append("--offline")
+    if args.resume:
+        cmd.append("--resume")
+    procs = [
+        subprocess.Popen(cmd + ["--shard", f"{index}/{args.shards}"])
+        for index in range(args.shards)
+    ]
+    return any([proc.wait() != 0 for proc in procs])
+
+
+def cmd_kastden(args) -> bool:
+    if args.shards:
+        return run_shards(args) or run_kastden(args, merge=args.shards)
+    return run_kastden(args, shard=args.shard, resume=args.resume)
+
+
+def cmd_merge(args) -> bool:
+    return run_kastden(args, merge=args.shards)
+
+
+def cmd_rebuild(args) -> bool:
+    return run_kastden(args, rebuild=True)
+
+
+def load_profiles(fpath: Path) -> dict:
+    with open(fpath, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def cmd_validate(args) -> bool:
+    from kpopnet.validate import validate_profiles
+
+    report = validate_profiles(load_profiles(args.file))  # type: ignore
+    if args.json:
+        json.dump(report.to_dict(), sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    elif not report.ok:
+        print(report)
+    checked = ", ".join(f"{n} {kind}" for kind, n in report.checked.items())
+    print(f"{len(report.violations)} violations in {checked}", file=sys.stderr)
+    return not report.ok
+
+
+def profile_stats(profiles: dict) -> dict:
+    stats = {}
+    for kind in ("idols", "groups"):
+        items = profiles[kind]
+        coverage = {}
+        for item in items:
+            for field, value in item.items():
+                filled = value is not None and value != []
+                coverage[field] = coverage.get(field, 0) + filled
+        stats[kind] = {"count": len(items), "coverage": coverage}
+    members = [m for group in profiles["groups"] for m in group["members"]]
+    stats["members"] = {
+        "count": len(members),
+        "current": sum(m["current"] for m in members),
+        "with_roles": sum(m["roles"] is not None for m in members),
+    }
+    stats["groups"]["subunits"] = sum(
+        g["parent_id"] is not None for g in profiles["groups"]
+    )
+    return stats
+
+
+def cmd_stats(args) -> bool:
+    stats = profile_stats(load_profiles(args.file))
+    if args.json:
+        json.dump(stats, sys.stdout, indent=2)
+        print()
+        return False
+    for kind in ("idols", "groups"):
+        count = stats[kind]["count"]
+        print(f"{kind}: {count}")
+        for field, filled in sorted(stats[kind]["coverage"].items()):
+            percent = 100 * filled / (count or 1)
+            print(f"  {field:<20}{filled:>8}{percent:>8.1f}%")
+    print(f"subunits: {stats['groups']['subunits']}")
+    members = stats["members"]
+    print(
+        f"members: {members['count']}, current: {members['current']}, "
+        f"with roles: {members['with_roles']}"
+    )
+    return False
+
+
+EXPORT_FORMATS = {
+    "min": "kpopnet.min.json",
+    "bin": "kpopnet.bin",
+    "search": "kpopnet.search.json",
+    "entities": "entities",
+    # idols.ndjson and groups.ndjson in output directory
+    "ndjson": ".",
+}
+
+
+def cmd_export(args) -> bool:
+    profiles = load_profiles(args.file)
+    out = args.output or Path(EXPORT_FORMATS[args.format])
+    if args.format == "min":
+        from kpopnet.dump import atomic_open
+
+        with atomic_open(out) as f:
+            json.dump(
+                profiles, f, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+            )
+    elif args.format == "bin":
+        from kpopnet.binary import dump_binary
+
+        dump_binary(profiles, out)  # type: ignore
+    elif args.format == "search":
+        from kpopnet.search import dump_search
+
+        dump_search(profiles, out)  # type: ignore
+    elif args.format == "entities":
+        from kpopnet.entities import dump_entities
+
+        dump_entities(profiles, out)  # type: ignore
+    elif args.format == "ndjson":
+        from kpopnet.ndjson import dump_ndjson
+
+        out.mkdir(parents=True, exist_ok=True)
+        for kind in ("idols", "groups"):
+            dump_ndjson(profiles[kind], out / f"{kind}.ndjson")
+    print(f"Written {out}", file=sys.stderr)
+    return False
 
 
 def main():
@@ -13,43 +205,95 @@ def main():
         prog="kpopnet",
         description="kpopnet web spiders and utils",
     )
-    parser.add_argument("kastden", nargs="?")
+    commands = parser.add_subparsers(dest="command", metavar="command")
 
-    args = parser.parse_args()
+    crawl = argparse.ArgumentParser(add_help=False)
+    mode = crawl.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--incremental",
+        action="store_true",
+        help="re-parse only pages changed since the previous crawl",
+    )
+    mode.add_argument(
+        "--offline",
+        action="store_true",
+        help="replay from HTTP cache only, fail on cache miss",
+    )
 
-    if args.kastden:
+    kastden = commands.add_parser("kastden", parents=[crawl], help="crawl kastden")
+    kastden.set_defaults(func=cmd_kastden)
+    kastden.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue interrupted crawl from its checkpoint",
+    )
+    shard = kastden.add_mutually_exclusive_group()
+    shard.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="crawl only I-th (0-based) of N slices of idols, merge later",
+    )
+    shard.add_argument(
+        "--shards",
+        type=int,
+        metavar="N",
+        help="crawl N shards in parallel processes and merge them",
+    )
 
-        def process_spider_error(failure, response, spider):
-            nonlocal had_error
-            had_error = True
+    merge = commands.add_parser(
+        "merge", parents=[crawl], help="merge results of sharded crawl"
+    )
+    merge.set_defaults(func=cmd_merge)
+    merge.add_argument(
+        "--shards",
+        type=int,
+        metavar="N",
+        required=True,
+        help="number of shards of the crawl",
+    )
 
-        def process_spider_closed(spider, reason):
-            nonlocal had_error
-            if reason != "finished":
-                had_error = True
+    rebuild = commands.add_parser(
+        "rebuild", help="apply current overrides to last crawl and dump"
+    )
+    rebuild.set_defaults(func=cmd_rebuild, incremental=False, offline=False)
 
-        had_error = False
+    dataset = argparse.ArgumentParser(add_help=False)
+    dataset.add_argument(
+        "file", nargs="?", type=Path, default=DEFAULT_FPATH, help="kpopnet.json"
+    )
 
-        process = CrawlerProcess(get_project_settings())
-        crawler = process.create_crawler("kastden")
-        crawler.signals.connect(process_spider_error, signals.spider_error)
-        crawler.signals.connect(process_spider_closed, signals.spider_closed)
-        process.crawl(crawler)
-        process.start()
+    validate = commands.add_parser(
+        "validate", parents=[dataset], help="check existing kpopnet.json"
+    )
+    validate.add_argument("--json", action="store_true", help="print full report")
+    validate.set_defaults(func=cmd_validate)
 
-        # XXX(Kagami): hackish way to catch exception in closed()
-        if crawler.stats and crawler.stats.get_value("log_count/ERROR", 0) != 0:
-            had_error = True
+    stats = commands.add_parser(
+        "stats", parents=[dataset], help="counts and field coverage"
+    )
+    stats.add_argument("--json", action="store_true", help="print as JSON")
+    stats.set_defaults(func=cmd_stats)
 
-        if had_error:
-            at = "@" * 50
-            print(f"\n{at}\nERROR OCCURED, PLEASE CHECK LOGS\n{at}", file=sys.stderr)
-            sys.exit(1)
+    export = commands.add_parser(
+        "export", parents=[dataset], help="build other formats from kpopnet.json"
+    )
+    export.add_argument("format", choices=EXPORT_FORMATS)
+    export.add_argument("-o", "--output", type=Path, help="output path")
+    export.set_defaults(func=cmd_export)
 
-    else:
+    args = parser.parse_args()
+    if not args.command:
         parser.print_usage(sys.stderr)
         sys.exit(1)
 
+    had_error = args.func(args)
+    if had_error and args.command in ("kastden", "merge", "rebuild"):
+        at = "@" * 50
+        print(f"\n{at}\nERROR OCCURED, PLEASE CHECK LOGS\n{at}", file=sys.stderr)
+    if had_error:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
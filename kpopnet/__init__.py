@@ -0,0 +1,34 @@
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .db import load, Database
+    from .binary import load_binary, BinaryProfiles
+    from .search import load_search, SearchIndex
+    from .delta import apply_delta, content_hash
+    from .ndjson import iter_idols, iter_groups
+
+# Exports are imported on first access, so that CLI and spider importing
+# some submodule don't pay for loading all of them
+EXPORTS = {
+    "load": "db",
+    "Database": "db",
+    "load_binary": "binary",
+    "BinaryProfiles": "binary",
+    "load_search": "search",
+    "SearchIndex": "search",
+    "apply_delta": "delta",
+    "content_hash": "delta",
+    "iter_idols": "ndjson",
+    "iter_groups": "ndjson",
+}
+
+__all__ = list(EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
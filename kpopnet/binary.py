@@ -0,0 +1,336 @@
+"""Compact columnar representation of kpopnet.json.
+
+Layout (little-endian):
+
+    header:    b"KPNB", version u32, section count u32, reserved u32
+    directory: per section name (24 bytes), typecode (8 bytes),
+               offset u64, item count u64
+    sections:  8-byte aligned arrays
+
+All strings are interned into one table and referenced by u32 index
+(0xFFFFFFFF means null). Dates are stored as u32 YYYYMMDD (0 means null),
+height/weight as float64 (NaN means null), references between idols and
+groups as row indexes. Variable-length lists use CSR layout: `<list>.offsets`
+with row count + 1 items pointing into flat `<list>.*` value arrays.
+Other top-level keys (e.g. thumb_variants) are kept as JSON in `meta`.
+
+Reader maps the file and casts sections in place, so opening is O(1) and
+records are materialized only on access.
+"""
+
+import io
+import sys
+import json
+import math
+import mmap
+import struct
+from array import array
+from pathlib import Path
+from typing import IO, Iterator, Optional, Union, cast
+
+from .items import Idol, Group, Profiles
+from .dump import atomic_open
+
+MAGIC = b"KPNB"
+VERSION = 1
+NULL = 0xFFFFFFFF
+HEADER = struct.Struct("<4sIII")
+DIR_ENTRY = struct.Struct("<24s8sQQ")
+
+IDOL_STR_FIELDS = [
+    "id",
+    "name",
+    "name_original",
+    "real_name",
+    "real_name_original",
+    "name_alias",
+    "thumb_url",
+]
+IDOL_DATE_FIELDS = ["birth_date", "debut_date"]
+IDOL_FLOAT_FIELDS = ["height", "weight"]
+GROUP_STR_FIELDS = [
+    "id",
+    "name",
+    "name_original",
+    "agency_name",
+    "name_alias",
+    "thumb_url",
+]
+GROUP_DATE_FIELDS = ["debut_date", "disband_date"]
+
+IDOL_FIELDS = set(IDOL_STR_FIELDS + IDOL_DATE_FIELDS + IDOL_FLOAT_FIELDS)
+IDOL_FIELDS |= {"urls", "groups"}
+GROUP_FIELDS = set(GROUP_STR_FIELDS + GROUP_DATE_FIELDS)
+GROUP_FIELDS |= {"urls", "members", "parent_id"}
+
+
+def pack_date(value: Optional[str]) -> int:
+    if value is None:
+        return 0
+    year, month, day = value.split("-")
+    assert len(year) == 4 and len(month) == 2 and len(day) == 2, value
+    return int(year) * 10000 + int(month) * 100 + int(day)
+
+
+def unpack_date(value: int) -> Optional[str]:
+    if not value:
+        return None
+    return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}"
+
+
+class Writer:
+    def __init__(self):
+        self.sections: dict[str, array] = {}
+        self.string_ids: dict[str, int] = {}
+        self.str_offsets = array("I", [0])
+        self.str_data = bytearray()
+
+    def column(self, name: str, typecode: str) -> array:
+        return self.sections.setdefault(name, array(typecode))
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return NULL
+        idx = self.string_ids.get(value)
+        if idx is None:
+            idx = self.string_ids[value] = len(self.string_ids)
+            self.str_data += value.encode()
+            self.str_offsets.append(len(self.str_data))
+        return idx
+
+    def add_strings(self, prefix: str, item: dict, fields: list[str]):
+        for field in fields:
+            self.column(f"{prefix}.{field}", "I").append(self.intern(item[field]))
+
+    def add_dates(self, prefix: str, item: dict, fields: list[str]):
+        for field in fields:
+            self.column(f"{prefix}.{field}", "I").append(pack_date(item[field]))
+
+    def add_urls(self, prefix: str, item: dict):
+        offsets = self.column(f"{prefix}.urls.offsets", "I")
+        values = self.column(f"{prefix}.urls", "I")
+        if not offsets:
+            offsets.append(0)
+        values.extend(self.intern(url) for url in item["urls"])
+        offsets.append(len(values))
+
+    def write(self, f: IO[bytes]):
+        self.sections["str.offsets"] = self.str_offsets
+        self.sections["str.data"] = array("B", self.str_data)
+        pos = HEADER.size + DIR_ENTRY.size * len(self.sections)
+        directory = []
+        for name, column in self.sections.items():
+            assert len(name) <= 24, name
+            pos += -pos % 8
+            directory.append((name, column, pos))
+            pos += len(column) * column.itemsize
+        f.write(HEADER.pack(MAGIC, VERSION, len(self.sections), 0))
+        for name, column, offset in directory:
+            typecode = column.typecode.encode()
+            f.write(DIR_ENTRY.pack(name.encode(), typecode, offset, len(column)))
+        for name, column, offset in directory:
+            f.write(b"\0" * (offset - f.tell()))
+            if sys.byteorder == "big":
+                column = array(column.typecode, column)
+                column.byteswap()
+            column.tofile(f)
+
+
+def encode_binary(profiles: Profiles, f: IO[bytes]):
+    idols = profiles["idols"]
+    groups = profiles["groups"]
+    idol_rows = dict((idol["id"], n) for n, idol in enumerate(idols))
+    group_rows = dict((group["id"], n) for n, group in enumerate(groups))
+
+    w = Writer()
+    group_offsets = w.column("idols.groups.offsets", "I")
+    group_offsets.append(0)
+    group_refs = w.column("idols.groups", "I")
+    for idol in idols:
+        assert set(idol) == IDOL_FIELDS, idol
+        w.add_strings("idols", idol, IDOL_STR_FIELDS)
+        w.add_dates("idols", idol, IDOL_DATE_FIELDS)
+        for field in IDOL_FLOAT_FIELDS:
+            value = idol[field]
+            w.column(f"idols.{field}", "d").append(
+                math.nan if value is None else value
+            )
+        w.add_urls("idols", idol)
+        group_refs.extend(group_rows[gid] for gid in idol["groups"])
+        group_offsets.append(len(group_refs))
+
+    member_offsets = w.column("groups.members.offsets", "I")
+    member_offsets.append(0)
+    member_refs = w.column("groups.members.idol", "I")
+    member_current = w.column("groups.members.current", "B")
+    member_roles = w.column("groups.members.roles", "I")
+    parents = w.column("groups.parent", "I")
+    for group in groups:
+        assert set(group) == GROUP_FIELDS, group
+        w.add_strings("groups", group, GROUP_STR_FIELDS)
+        w.add_dates("groups", group, GROUP_DATE_FIELDS)
+        w.add_urls("groups", group)
+        parent_id = group["parent_id"]
+        parents.append(NULL if parent_id is None else group_rows[parent_id])
+        for member in group["members"]:
+            member_refs.append(idol_rows[member["idol_id"]])
+            member_current.append(member["current"])
+            member_roles.append(w.intern(member["roles"]))
+        member_offsets.append(len(member_refs))
+
+    # always present, even for empty dataset
+    w.column("idols.id", "I")
+    w.column("groups.id", "I")
+    meta = dict((k, v) for k, v in profiles.items() if k not in ("idols", "groups"))
+    w.sections["meta"] = array("B", json.dumps(meta).encode())
+    w.write(f)
+
+
+def dump_binary(profiles: Profiles, fpath: Path):
+    with atomic_open(fpath, "wb") as f:
+        encode_binary(profiles, f)
+
+
+def binary_bytes(profiles: Profiles) -> bytes:
+    f = io.BytesIO()
+    encode_binary(profiles, f)
+    return f.getvalue()
+
+
+class BinaryProfiles:
+    def __init__(self, source: Union[str, Path, bytes]):
+        """Map file in place, or use already encoded bytes."""
+        self.mm: Optional[mmap.mmap] = None
+        if isinstance(source, bytes):
+            self.buf = buf = memoryview(source)
+        else:
+            with open(source, "rb") as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buf = buf = memoryview(self.mm)
+        magic, version, count, _ = HEADER.unpack_from(buf)
+        assert magic == MAGIC and version == VERSION, (magic, version)
+        self.sections: dict[str, memoryview] = {}
+        for n in range(count):
+            name, typecode, offset, length = DIR_ENTRY.unpack_from(
+                buf, HEADER.size + DIR_ENTRY.size * n
+            )
+            tc = typecode.rstrip(b"\0").decode()
+            size = length * array(tc).itemsize
+            view = buf[offset : offset + size].cast(tc)
+            if sys.byteorder == "big":
+                swapped = array(tc, view)
+                swapped.byteswap()
+                view = memoryview(swapped)
+            self.sections[name.rstrip(b"\0").decode()] = view
+        self.str_offsets = self.sections["str.offsets"]
+        self.str_data = self.sections["str.data"]
+        self.idol_count = len(self.sections["idols.id"])
+        self.group_count = len(self.sections["groups.id"])
+        self._idol_rows: Optional[dict[str, int]] = None
+        self._group_rows: Optional[dict[str, int]] = None
+
+    def close(self):
+        # mmap can't be closed while there are exported buffers
+        for view in self.sections.values():
+            view.release()
+        self.buf.release()
+        if self.mm is not None:
+            self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string(self, idx: int) -> Optional[str]:
+        if idx == NULL:
+            return None
+        start = self.str_offsets[idx]
+        end = self.str_offsets[idx + 1]
+        return str(self.str_data[start:end], "utf-8")
+
+    def list_values(self, name: str, row: int) -> memoryview:
+        """Values of CSR list column for the row."""
+        offsets = self.sections[name + ".offsets"]
+        return self.sections[name][offsets[row] : offsets[row + 1]]
+
+    def _fill(self, item: dict, prefix: str, row: int, str_fields, date_fields):
+        for field in str_fields:
+            item[field] = self.string(self.sections[f"{prefix}.{field}"][row])
+        for field in date_fields:
+            item[field] = unpack_date(self.sections[f"{prefix}.{field}"][row])
+        urls = self.list_values(f"{prefix}.urls", row)
+        item["urls"] = [self.string(i) for i in urls]
+
+    def idol(self, row: int) -> Idol:
+        idol = {}
+        self._fill(idol, "idols", row, IDOL_STR_FIELDS, IDOL_DATE_FIELDS)
+        for field in IDOL_FLOAT_FIELDS:
+            value = self.sections[f"idols.{field}"][row]
+            idol[field] = None if math.isnan(value) else value
+        group_ids = self.sections["groups.id"]
+        idol["groups"] = [
+            self.string(group_ids[g]) for g in self.list_values("idols.groups", row)
+        ]
+        return cast(Idol, idol)
+
+    def group(self, row: int) -> Group:
+        group = {}
+        self._fill(group, "groups", row, GROUP_STR_FIELDS, GROUP_DATE_FIELDS)
+        parent = self.sections["groups.parent"][row]
+        group_ids = self.sections["groups.id"]
+        group["parent_id"] = None if parent == NULL else self.string(group_ids[parent])
+        offsets = self.sections["groups.members.offsets"]
+        idol_refs = self.sections["groups.members.idol"]
+        current = self.sections["groups.members.current"]
+        roles = self.sections["groups.members.roles"]
+        idol_ids = self.sections["idols.id"]
+        group["members"] = [
+            {
+                "idol_id": self.string(idol_ids[idol_refs[m]]),
+                "current": bool(current[m]),
+                "roles": self.string(roles[m]),
+            }
+            for m in range(offsets[row], offsets[row + 1])
+        ]
+        return cast(Group, group)
+
+    def idols(self) -> Iterator[Idol]:
+        return (self.idol(row) for row in range(self.idol_count))
+
+    def groups(self) -> Iterator[Group]:
+        return (self.group(row) for row in range(self.group_count))
+
+    def idol_row(self, idol_id: str) -> Optional[int]:
+        if self._idol_rows is None:
+            ids = self.sections["idols.id"]
+            self._idol_rows = dict((self.string(i), n) for n, i in enumerate(ids))
+        return self._idol_rows.get(idol_id)
+
+    def group_row(self, group_id: str) -> Optional[int]:
+        if self._group_rows is None:
+            ids = self.sections["groups.id"]
+            self._group_rows = dict((self.string(i), n) for n, i in enumerate(ids))
+        return self._group_rows.get(group_id)
+
+    def get_idol(self, idol_id: str) -> Optional[Idol]:
+        row = self.idol_row(idol_id)
+        return None if row is None else self.idol(row)
+
+    def get_group(self, group_id: str) -> Optional[Group]:
+        row = self.group_row(group_id)
+        return None if row is None else self.group(row)
+
+    def meta(self) -> dict:
+        return json.loads(str(self.sections["meta"], "utf-8"))
+
+    def to_profiles(self) -> Profiles:
+        profiles = self.meta()
+        profiles["idols"] = list(self.idols())
+        profiles["groups"] = list(self.groups())
+        return cast(Profiles, profiles)
+
+
+def load_binary(fpath: Union[str, Path]) -> BinaryProfiles:
+    return BinaryProfiles(fpath)
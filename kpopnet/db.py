@@ -0,0 +1,111 @@
+import json
+import unicodedata
+from pathlib import Path
+from functools import cached_property
+from typing import Iterator, Optional, Union
+
+from .binary import BinaryProfiles, binary_bytes
+from .items import Idol, Group
+
+DEFAULT_FPATH = Path(__file__).parent / ".." / "kpopnet.json"
+
+
+def normalize_name(name: str) -> str:
+    name = unicodedata.normalize("NFKC", name).casefold()
+    return "".join(c for c in name if c.isalnum())
+
+
+# Read-only view over kpopnet.bin.
+# File is mapped, records are materialized on access and relations are read
+# from row-indexed columns. Only name index is kept, built on first search.
+class Database:
+    def __init__(self, profiles: BinaryProfiles):
+        self.profiles = profiles
+
+    def close(self):
+        self.profiles.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @cached_property
+    def names(self) -> dict[str, list[tuple[str, int]]]:
+        names: dict[str, list[tuple[str, int]]] = {}
+        bp = self.profiles
+        for kind, count in [("idols", bp.idol_count), ("groups", bp.group_count)]:
+            for field in ("name", "name_original"):
+                column = bp.sections[f"{kind}.{field}"]
+                for row in range(count):
+                    key = normalize_name(bp.string(column[row]) or "")
+                    entry = names.setdefault(key, [])
+                    if (kind, row) not in entry:
+                        entry.append((kind, row))
+        return names
+
+    def get_idol(self, idol_id: str) -> Optional[Idol]:
+        return self.profiles.get_idol(idol_id)
+
+    def get_group(self, group_id: str) -> Optional[Group]:
+        return self.profiles.get_group(group_id)
+
+    def idols(self) -> Iterator[Idol]:
+        return self.profiles.idols()
+
+    def groups(self) -> Iterator[Group]:
+        return self.profiles.groups()
+
+    def find(self, name: str) -> list[Union[Idol, Group]]:
+        """Find idols and groups by name or original name."""
+        result: list[Union[Idol, Group]] = []
+        for kind, row in self.names.get(normalize_name(name), []):
+            if kind == "idols":
+                result.append(self.profiles.idol(row))
+            else:
+                result.append(self.profiles.group(row))
+        return result
+
+    def find_idols(self, name: str) -> list[Idol]:
+        return [i for i in self.find(name) if "groups" in i]
+
+    def find_groups(self, name: str) -> list[Group]:
+        return [g for g in self.find(name) if "members" in g]
+
+    def current_members(self, group_id: str) -> list[Idol]:
+        bp = self.profiles
+        row = bp.group_row(group_id)
+        if row is None:
+            return []
+        offsets = bp.sections["groups.members.offsets"]
+        idol_refs = bp.sections["groups.members.idol"]
+        current = bp.sections["groups.members.current"]
+        return [
+            bp.idol(idol_refs[m])
+            for m in range(offsets[row], offsets[row + 1])
+            if current[m]
+        ]
+
+    def idol_groups(self, idol_id: str) -> list[Group]:
+        bp = self.profiles
+        row = bp.idol_row(idol_id)
+        if row is None:
+            return []
+        return [bp.group(g) for g in bp.list_values("idols.groups", row)]
+
+
+def load(fpath: Union[str, Path] = DEFAULT_FPATH) -> Database:
+    """Open kpopnet.bin dumped next to given kpopnet.json.
+
+    JSON file without up-to-date binary next to it is converted in memory,
+    which is much slower.
+    """
+    fpath = Path(fpath)
+    bin_fpath = fpath.with_suffix(".bin")
+    if fpath == bin_fpath or (
+        bin_fpath.exists() and bin_fpath.stat().st_mtime >= fpath.stat().st_mtime
+    ):
+        return Database(BinaryProfiles(bin_fpath))
+    with open(fpath, encoding="utf-8") as f:
+        return Database(BinaryProfiles(binary_bytes(json.load(f))))
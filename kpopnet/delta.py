@@ -0,0 +1,164 @@
+"""Difference between two releases of kpopnet.json.
+
+Delta layout:
+
+    {
+      "from": <content hash of previous release>,
+      "to": <content hash of new release>,
+      "idols"/"groups": {
+        "added": [full items],
+        "removed": [ids],
+        "changed": {id: {field: new value}}
+      },
+      "members": {group id: {"added": [members], "removed": [idol ids],
+                             "changed": {idol id: {field: new value}}}},
+      "meta": {"changed": {top-level key: new value}, "removed": [keys]}
+    }
+
+Order of items isn't stored, lists are re-sorted with the same keys as used
+by linking, which makes applied result byte-identical to the new release.
+"""
+
+import json
+import hashlib
+import subprocess
+from pathlib import Path
+from typing import Any, Optional
+
+from .dump import atomic_open, encode
+from .items import Profiles
+from .link import idol_key, group_key
+
+LIST_KEYS = ("idols", "groups")
+
+
+def content_hash(profiles: Profiles) -> str:
+    """SHA-256 of minified JSON, i.e. of kpopnet.min.json contents."""
+    h = hashlib.sha256()
+    encode(profiles, lambda s: None, lambda s: h.update(s.encode()))
+    return h.hexdigest()
+
+
+def diff_items(old: list[dict], new: list[dict], key: str, skip=()) -> dict:
+    old_by_key = dict((item[key], item) for item in old)
+    new_keys = set(item[key] for item in new)
+    added = []
+    changed = {}
+    for item in new:
+        old_item = old_by_key.get(item[key])
+        if old_item is None:
+            added.append(item)
+            continue
+        fields = dict(
+            (field, value)
+            for field, value in item.items()
+            if field not in skip
+            and (field not in old_item or old_item[field] != value)
+        )
+        if fields:
+            changed[item[key]] = fields
+    removed = [k for k in old_by_key if k not in new_keys]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def make_delta(old: Profiles, new: Profiles) -> dict:
+    delta: dict[str, Any] = {"from": content_hash(old), "to": content_hash(new)}
+    delta["idols"] = diff_items(old["idols"], new["idols"], "id")
+    delta["groups"] = diff_items(old["groups"], new["groups"], "id", ["members"])
+    delta["members"] = {}
+    old_groups = dict((group["id"], group) for group in old["groups"])
+    for group in new["groups"]:
+        old_group = old_groups.get(group["id"])
+        if old_group is None:
+            continue  # added with all members
+        members = diff_items(old_group["members"], group["members"], "idol_id")
+        if any(members.values()):
+            delta["members"][group["id"]] = members
+    changed = dict(
+        (k, v) for k, v in new.items() if k not in LIST_KEYS and old.get(k) != v
+    )
+    removed = [k for k in old if k not in new]
+    delta["meta"] = {"changed": changed, "removed": removed}
+    return delta
+
+
+def patch_items(items: list[dict], delta: dict, key: str) -> list[dict]:
+    removed = set(delta["removed"])
+    items = [item for item in items if item[key] not in removed]
+    for item in items:
+        fields = delta["changed"].get(item[key])
+        if fields:
+            item.update(fields)
+    return items + delta["added"]
+
+
+def apply_delta(profiles: Profiles, delta: dict, verify: bool = True) -> Profiles:
+    """Update previous release to the new one *in place*.
+
+    With verify, content hashes are checked before and after patching.
+    """
+    if verify:
+        assert content_hash(profiles) == delta["from"], "delta for other release"
+    idols = patch_items(profiles["idols"], delta["idols"], "id")
+    groups = patch_items(profiles["groups"], delta["groups"], "id")
+    idols.sort(key=idol_key, reverse=True)  # type: ignore
+    groups.sort(key=group_key, reverse=True)  # type: ignore
+    # members are listed in the order of idols
+    idol_rank = dict((idol["id"], n) for n, idol in enumerate(idols))
+    for group in groups:
+        members_delta = delta["members"].get(group["id"])
+        if members_delta:
+            group["members"] = patch_items(group["members"], members_delta, "idol_id")
+        group["members"].sort(key=lambda m: idol_rank[m["idol_id"]])
+    profiles["idols"] = idols
+    profiles["groups"] = groups
+    for key in delta["meta"]["removed"]:
+        del profiles[key]  # type: ignore
+    profiles.update(delta["meta"]["changed"])  # type: ignore
+    if verify:
+        assert content_hash(profiles) == delta["to"], "bad delta result"
+    return profiles
+
+
+def load_release(fpath: Path, rev: str = "HEAD") -> Optional[Profiles]:
+    """Read kpopnet.json as committed in given revision.
+
+    File in the tree may be output of earlier unreleased dump (e.g. rebuild)
+    so released one is taken from git. None if file isn't committed.
+    """
+    try:
+        data = subprocess.run(
+            ["git", "show", f"{rev}:./{fpath.name}"],
+            cwd=fpath.parent,
+            capture_output=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return json.loads(data)
+
+
+def file_hash(fpath: Path) -> str:
+    return hashlib.sha256(fpath.read_bytes()).hexdigest()
+
+
+def dump_delta(
+    old: Optional[Profiles],
+    new: Profiles,
+    files: list[Path],
+    delta_fpath: Path,
+    manifest_fpath: Path,
+):
+    """Write delta from previous release (if any) and manifest of new one."""
+    manifest: dict[str, Any] = {"hash": content_hash(new), "files": {}}
+    for fpath in files:
+        manifest["files"][fpath.name] = file_hash(fpath)
+    if old is not None:
+        delta = make_delta(old, new)
+        with atomic_open(delta_fpath) as f:
+            json.dump(delta, f, ensure_ascii=False, sort_keys=True)
+        manifest["delta"] = {"file": delta_fpath.name, "from": delta["from"]}
+        manifest["files"][delta_fpath.name] = file_hash(delta_fpath)
+    with atomic_open(manifest_fpath) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
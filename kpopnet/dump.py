@@ -0,0 +1,93 @@
+import os
+import tempfile
+from pathlib import Path
+from json.encoder import encode_basestring
+from typing import IO, Callable, Iterator, Any
+from contextlib import contextmanager
+
+Write = Callable[[str], Any]
+
+
+# Encodes object once, writing both pretty (indent=2) and minified output.
+# Result is byte-identical to:
+#   json.dump(obj, f, ensure_ascii=False, sort_keys=True, indent=2)
+#   json.dump(obj, f, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+def encode(obj, wpretty: Write, wmin: Write, indent: str = ""):
+    if isinstance(obj, str):
+        s = encode_basestring(obj)
+    elif obj is None:
+        s = "null"
+    elif obj is True:
+        s = "true"
+    elif obj is False:
+        s = "false"
+    elif isinstance(obj, int):
+        s = int.__repr__(obj)
+    elif isinstance(obj, float):
+        s = float.__repr__(obj)
+    elif isinstance(obj, dict):
+        if not obj:
+            s = "{}"
+        else:
+            inner = indent + "  "
+            sep = "{\n" + inner
+            for key in sorted(obj):
+                s = encode_basestring(key)
+                wpretty(sep + s + ": ")
+                wmin(sep[0] + s + ":")
+                encode(obj[key], wpretty, wmin, inner)
+                sep = ",\n" + inner
+            wpretty("\n" + indent + "}")
+            wmin("}")
+            return
+    elif isinstance(obj, (list, tuple)):
+        if not obj:
+            s = "[]"
+        else:
+            inner = indent + "  "
+            sep = "[\n" + inner
+            for value in obj:
+                wpretty(sep)
+                wmin(sep[0])
+                encode(value, wpretty, wmin, inner)
+                sep = ",\n" + inner
+            wpretty("\n" + indent + "]")
+            wmin("]")
+            return
+    else:
+        raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+    wpretty(s)
+    wmin(s)
+
+
+@contextmanager
+def atomic_open(fpath: Path, mode: str = "w") -> Iterator[IO]:
+    """Write to a temporary file, replace target only on success.
+
+    Temporary file name is unique, so concurrent writers never share it.
+    """
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=fpath.name + ".", suffix=".tmp", dir=fpath.parent
+    )
+    tmp_fpath = Path(tmp_name)
+    encoding = None if "b" in mode else "utf-8"
+    try:
+        with open(fd, mode, encoding=encoding) as f:
+            # mkstemp creates file readable only by owner
+            os.chmod(tmp_fpath, 0o644)
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        tmp_fpath.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_fpath, fpath)
+
+
+def dump_json(obj, json_fpath: Path, minjson_fpath: Path):
+    """Dump pretty and minified JSON in one pass.
+
+    Previous files are kept in place until both new ones are fully written.
+    """
+    with atomic_open(json_fpath) as fpretty, atomic_open(minjson_fpath) as fmin:
+        encode(obj, fpretty.write, fmin.write)
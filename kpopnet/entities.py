@@ -0,0 +1,84 @@
+"""Per-entity JSON files for partial fetching.
+
+Layout of output directory:
+
+    index.json                       {"idols": {id: hash}, "groups": {id: hash}}
+    idols/<id>.<hash>.json           single idol record
+    groups/<id>.<hash>.json          single group record
+
+Hash is a prefix of SHA-256 of file contents, so entity files never change
+and can be cached forever, only index.json has to be revalidated. Every file
+also has precompressed .gz and .br (if brotli module is available) versions.
+"""
+
+import os
+import json
+import gzip
+import hashlib
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .dump import atomic_open
+from .items import Profiles
+
+HASH_LEN = 16
+LIST_KEYS = ("idols", "groups")
+
+
+def encode_entity(obj) -> bytes:
+    return json.dumps(
+        obj, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    ).encode()
+
+
+def write_file(fpath: Path, data: bytes):
+    with atomic_open(fpath, "wb") as f:
+        f.write(data)
+
+
+def write_compressed(fpath: Path, data: bytes):
+    """Write file with its precompressed versions, the plain one last."""
+    # mtime=0 keeps output reproducible
+    write_file(fpath.with_name(fpath.name + ".gz"), gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        write_file(fpath.with_name(fpath.name + ".br"), brotli.compress(data))
+    write_file(fpath, data)
+
+
+def entity_fname(entity_id: str, content_hash: str) -> str:
+    return f"{entity_id}.{content_hash}.json"
+
+
+def dump_entities(profiles: Profiles, out_dpath: Path) -> int:
+    """Write per-entity files and index, remove stale ones.
+
+    Files with unchanged contents are kept as is. Returns number of written
+    entity files.
+    """
+    index: dict[str, dict[str, str]] = {}
+    written = 0
+    for kind in LIST_KEYS:
+        dpath = out_dpath / kind
+        os.makedirs(dpath, exist_ok=True)
+        index[kind] = {}
+        fnames = set()
+        for item in profiles[kind]:  # type: ignore
+            data = encode_entity(item)
+            content_hash = hashlib.sha256(data).hexdigest()[:HASH_LEN]
+            index[kind][item["id"]] = content_hash
+            fname = entity_fname(item["id"], content_hash)
+            fnames.add(fname)
+            if not (dpath / fname).exists():
+                write_compressed(dpath / fname, data)
+                written += 1
+        for fpath in dpath.iterdir():
+            if fpath.suffix == ".tmp":
+                continue  # being written by atomic_open
+            if fpath.name.removesuffix(".gz").removesuffix(".br") not in fnames:
+                fpath.unlink()
+    write_compressed(out_dpath / "index.json", encode_entity(index))
+    return written
@@ -0,0 +1,188 @@
+import json
+import time
+import bisect
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.project import data_path
+from twisted.internet import task
+
+from .dump import atomic_open
+from .middlewares import callback_done
+
+BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, float("inf")]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "buckets": dict(zip(map(str, BUCKETS), self.counts)),
+        }
+
+
+class CrawlMetrics:
+    """Periodically write crawl throughput metrics to a file.
+
+    Format is Prometheus text if METRICS_FILE ends with .prom, JSON otherwise.
+    """
+
+    def __init__(self, crawler, fpath, interval: float):
+        self.crawler = crawler
+        self.fpath = fpath
+        self.interval = interval
+        self.callbacks: dict[str, Histogram] = {}
+        self.pages = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.last = (self.started, 0, 0)
+        self.task = None
+        self.final = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        interval = crawler.settings.getfloat("METRICS_INTERVAL")
+        if not interval:
+            raise NotConfigured
+        ext = cls(crawler, crawler.settings.get("METRICS_FILE"), interval)
+        crawler.signals.connect(ext.spider_opened, signals.spider_opened)
+        crawler.signals.connect(ext.response_received, signals.response_received)
+        crawler.signals.connect(ext.callback_done, callback_done)
+        crawler.signals.connect(ext.spider_closed, signals.spider_closed)
+        # Final snapshot needs stage timings which spider's closed() stores
+        # in stats. It's a spider_closed handler too and order of handlers
+        # of one signal depends on when they were connected, engine_stopped
+        # is sent only after all of them have finished.
+        crawler.signals.connect(ext.engine_stopped, signals.engine_stopped)
+        return ext
+
+    def spider_opened(self, spider):
+        if self.fpath is None:
+            self.fpath = Path(data_path(spider.name, createdir=True)) / "metrics.json"
+        self.fpath = Path(self.fpath)
+        shard = getattr(spider, "shard", None)
+        if shard:
+            # shard processes run at the same time, each writes its own file
+            index, count = shard
+            name = f"{self.fpath.stem}.{index}-of-{count}{self.fpath.suffix}"
+            self.fpath = self.fpath.with_name(name)
+        self.started = time.perf_counter()
+        self.last = (self.started, 0, 0)
+        self.task = task.LoopingCall(self.write)
+        self.task.start(self.interval, now=False)
+
+    def response_received(self, response, request, spider):
+        self.pages += 1
+        self.bytes += len(response.body)
+
+    def callback_done(self, callback: str, seconds: float):
+        self.callbacks.setdefault(callback, Histogram()).observe(seconds)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+
+    def engine_stopped(self):
+        self.final = self.snapshot()
+        self.write(self.final)
+
+    def snapshot(self) -> dict:
+        now = time.perf_counter()
+        last_time, last_pages, last_bytes = self.last
+        self.last = (now, self.pages, self.bytes)
+        elapsed = now - self.started
+        period = (now - last_time) or 1e-9
+        stats = self.crawler.stats.get_stats()
+        enqueued = stats.get("scheduler/enqueued", 0)
+        dequeued = stats.get("scheduler/dequeued", 0)
+        engine = self.crawler.engine
+        active = len(engine.downloader.active) if engine else 0
+        return {
+            "elapsed": elapsed,
+            "pages": self.pages,
+            "bytes": self.bytes,
+            "pages_per_sec": self.pages / (elapsed or 1e-9),
+            "bytes_per_sec": self.bytes / (elapsed or 1e-9),
+            "pages_per_sec_current": (self.pages - last_pages) / period,
+            "bytes_per_sec_current": (self.bytes - last_bytes) / period,
+            "queue_depth": enqueued - dequeued,
+            "downloads_active": active,
+            "thumbs_queue_depth": stats.get("thumbs/queue_depth", 0),
+            "callbacks": dict((k, h.to_dict()) for k, h in self.callbacks.items()),
+            "stages": dict(
+                (k[5:-5], {"wall": v, "cpu": stats[k[:-5] + "/cpu"]})
+                for k, v in stats.items()
+                if k.startswith("time/") and k.endswith("/wall")
+            ),
+        }
+
+    def write(self, metrics=None):
+        metrics = metrics or self.snapshot()
+        with atomic_open(self.fpath) as f:
+            if self.fpath.suffix == ".prom":
+                f.write(to_prometheus(metrics))
+            else:
+                json.dump(metrics, f, indent=2)
+
+    def summary(self) -> str:
+        m = self.final or self.snapshot()
+        lines = [
+            f"pages: {m['pages']} ({m['pages_per_sec']:.1f}/s), "
+            f"bytes: {m['bytes']} ({m['bytes_per_sec'] / 1024:.1f} KiB/s), "
+            f"elapsed: {m['elapsed']:.1f}s",
+            f"{'callback':<16}{'count':>8}{'mean':>10}{'max':>10}",
+        ]
+        for name, h in m["callbacks"].items():
+            mean = h["sum"] / h["count"]
+            lines.append(f"{name:<16}{h['count']:>8}{mean:>9.4f}s{h['max']:>9.4f}s")
+        lines.append(f"{'stage':<16}{'wall':>10}{'cpu':>10}")
+        for stage, t in m["stages"].items():
+            lines.append(f"{stage:<16}{t['wall']:>9.3f}s{t['cpu']:>9.3f}s")
+        return "\n".join(lines)
+
+
+def to_prometheus(metrics: dict) -> str:
+    lines = []
+    for key in [
+        "elapsed",
+        "pages",
+        "bytes",
+        "pages_per_sec_current",
+        "bytes_per_sec_current",
+        "queue_depth",
+        "downloads_active",
+        "thumbs_queue_depth",
+    ]:
+        lines.append(f"kpopnet_crawl_{key} {metrics[key]}")
+    lines.append("# TYPE kpopnet_callback_seconds histogram")
+    for name, h in metrics["callbacks"].items():
+        cumulative = 0
+        for le, count in h["buckets"].items():
+            cumulative += count
+            le = "+Inf" if le == "inf" else le
+            lines.append(
+                f'kpopnet_callback_seconds_bucket{{callback="{name}",le="{le}"}}'
+                f" {cumulative}"
+            )
+        lines.append(f'kpopnet_callback_seconds_sum{{callback="{name}"}} {h["sum"]}')
+        count = h["count"]
+        lines.append(f'kpopnet_callback_seconds_count{{callback="{name}"}} {count}')
+    for stage, t in metrics["stages"].items():
+        lines.append(f'kpopnet_stage_wall_seconds{{stage="{stage}"}} {t["wall"]}')
+        lines.append(f'kpopnet_stage_cpu_seconds{{stage="{stage}"}} {t["cpu"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,128 @@
+"""HTTP cache storage in a single SQLite file.
+
+Every response is one row keyed by request fingerprint, bodies are
+zlib-compressed except images which are already compressed and are stored
+as is. After a full crawl (spider sets prune_cache) entries it didn't reach
+are removed and the file is compacted.
+"""
+
+import time
+import zlib
+import sqlite3
+from pathlib import Path
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+COMPRESSION_LEVEL = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    fingerprint BLOB PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers BLOB NOT NULL,
+    body BLOB NOT NULL,
+    compressed INTEGER NOT NULL,
+    time REAL NOT NULL
+)
+"""
+
+
+def is_image(headers: Headers) -> bool:
+    return (headers.get(b"Content-Type") or b"").startswith(b"image/")
+
+
+class SqliteCacheStorage:
+    def __init__(self, settings):
+        self.cachedir = Path(data_path(settings["HTTPCACHE_DIR"], createdir=True))
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.prune = settings.getbool("HTTPCACHE_PRUNE")
+        self.db = None
+        # fingerprints of entries used by this crawl
+        self.seen: set[bytes] = set()
+
+    def open_spider(self, spider):
+        self.fpath = self.cachedir / f"{spider.name}.sqlite"
+        # shards share the file, wait for each other's writes
+        self.db = sqlite3.connect(self.fpath, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        self.fingerprinter = spider.crawler.request_fingerprinter
+        spider.logger.debug(f"Using SQLite cache storage in {self.fpath}")
+
+    def close_spider(self, spider):
+        stats = spider.crawler.stats
+        pruned = 0
+        if self.prune and getattr(spider, "prune_cache", False):
+            pruned = self.prune_unseen()
+            stats.set_value("httpcache/pruned", pruned)
+        (entries,) = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        self.db.close()
+        self.db = None
+        hits = stats.get_value("httpcache/hit", 0)
+        misses = stats.get_value("httpcache/miss", 0)
+        hit_rate = hits / (hits + misses) if hits + misses else 0.0
+        size = self.fpath.stat().st_size
+        stats.set_value("httpcache/hit_rate", hit_rate)
+        stats.set_value("httpcache/entries", entries)
+        stats.set_value("httpcache/file_size", size)
+        spider.logger.info(
+            f"HTTP cache: {hit_rate:.1%} hit rate, {entries} entries "
+            f"({pruned} pruned), {size / 1024 / 1024:.1f} MiB"
+        )
+
+    def prune_unseen(self) -> int:
+        self.db.execute("CREATE TEMP TABLE seen (fingerprint BLOB PRIMARY KEY)")
+        self.db.execute("BEGIN")
+        self.db.executemany("INSERT INTO seen VALUES (?)", ((fp,) for fp in self.seen))
+        cursor = self.db.execute(
+            "DELETE FROM responses WHERE fingerprint NOT IN (SELECT * FROM seen)"
+        )
+        self.db.execute("COMMIT")
+        if cursor.rowcount:
+            self.db.execute("VACUUM")
+        return cursor.rowcount
+
+    def retrieve_response(self, spider, request):
+        fingerprint = self.fingerprinter.fingerprint(request)
+        row = self.db.execute(
+            "SELECT url, status, headers, body, compressed, time FROM responses "
+            "WHERE fingerprint = ?",
+            (fingerprint,),
+        ).fetchone()
+        if row is None:
+            return None  # not cached
+        url, status, raw_headers, body, compressed, timestamp = row
+        if 0 < self.expiration_secs < time.time() - timestamp:
+            return None  # expired
+        self.seen.add(fingerprint)
+        request.meta["cache_timestamp"] = timestamp
+        if compressed:
+            body = zlib.decompress(body)
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        fingerprint = self.fingerprinter.fingerprint(request)
+        body = response.body
+        compressed = not is_image(response.headers)
+        if compressed:
+            body = zlib.compress(body, COMPRESSION_LEVEL)
+        self.seen.add(fingerprint)
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                fingerprint,
+                response.url,
+                response.status,
+                headers_dict_to_raw(response.headers),
+                body,
+                compressed,
+                time.time(),
+            ),
+        )
@@ -1,6 +1,9 @@
 import base64
 import hashlib
-from typing import TypedDict, Optional, Sequence, Mapping, NotRequired
+from typing import TypedDict, Optional, NotRequired, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .overrides import OverrideIndex
 
 
 # NOTE(Kagami): Should match with types in kpopnet.d.ts!
@@ -48,9 +51,17 @@ class Group(TypedDict):
     parent_id: Optional[str]
 
 
+# Resized copies of every thumbnail, available at thumb_url with ".jpg"
+# replaced by ".<size>.<format>"
+class ThumbVariants(TypedDict):
+    sizes: list[int]
+    formats: list[str]
+
+
 class Profiles(TypedDict):
     groups: list[Group]
     idols: list[Idol]
+    thumb_variants: NotRequired[ThumbVariants]
 
 
 class Override(TypedDict):
@@ -63,46 +74,37 @@ class Overrides(TypedDict):
     groups: list[Override]
 
 
-# Runtime validation/data fixes
+DATE_PATTERN = r"\d{4}-\d{2}-\d{2}"
+ID_PATTERN = r"[\w-]{20}"
+THUMB_URL_PATTERN = r"https://up\.kpop\.re/net/[0-9a-f]{2}/[0-9a-f]{38}\.jpg"
+KPOPNET_URL_PATTERN = r"https://net\.kpop\.re/\?id=[\w-]{20}"
+NAMU_URL_PATTERN = r"https://namu\.wiki/w/.+"
+
+
+# Runtime validation/data fixes, see validate.py for checks of final items
 class Validator:
+    SCHEMA: type
     REQUIRED_FIELDS = []
     OPTIONAL_FIELDS = []
     OTHER_FIELDS = []
     UNIQUE_FIELDS = []
+    # field -> regexp for non-null values
+    PATTERNS = {}
+    # regexp per position in urls
+    URL_PATTERNS = []
 
     @classmethod
-    def override_urls(cls, item: dict, update: dict):
-        url_keys = []
-        for key in update:
-            if key.startswith("urls"):
-                url_keys.append(key)
-        if not url_keys:
-            return
-
-        for key in url_keys:
-            val = update.pop(key)
-            idx = int(key[5:-1])  # urls[x] -> x
-            # FIXME(Kagami): kpopnet url is inserted later
-            item["urls"][idx - 1] = val
-        return update
-
-    @classmethod
-    def normalize(cls, item: dict, overrides: list[Override]):
-        for override in overrides:
-            matched = all(item[k] == v for k, v in override["match"].items())
-            if matched:
-                override_update = override["update"].copy()
-                cls.override_urls(item, override_update)
-                item.update(override_update)
-                break
+    def normalize(cls, item: dict, overrides: "OverrideIndex"):
+        overrides.apply(item)
         for field in cls.REQUIRED_FIELDS:
             assert item.get(field), (field, item)
         for field in cls.OPTIONAL_FIELDS:
             if field not in item:
                 item[field] = None
         item["id"] = cls.gen_id(item)
+        # can't change ID but can fix other fields of already known item
+        overrides.apply(item, by_id=True)
         item["urls"].insert(0, cls.get_kpopnet_url(item))
-        # TODO: overrides by id here?
 
     @staticmethod
     def hash(s: str) -> str:
@@ -117,49 +119,9 @@ class Validator:
     def get_kpopnet_url(cls, item: dict) -> str:
         return f"https://net.kpop.re/?id={item['id']}"
 
-    # TODO: validate types, regular expression
-    @classmethod
-    def validate(cls, item: Mapping):
-        allowed_fields = set(
-            cls.REQUIRED_FIELDS + cls.OPTIONAL_FIELDS + cls.OTHER_FIELDS + ["id"]
-        )
-        current_fields = set(item.keys())
-        assert allowed_fields == current_fields, (allowed_fields, current_fields)
-        cls.validate_urls(item)
-
-    @classmethod
-    def validate_urls(cls, item: Mapping):
-        assert 2 <= len(item["urls"]) <= 3, item
-        assert item["urls"][0].startswith("https://net.kpop.re/?id="), item
-        if "members" in item:
-            assert item["urls"][1].startswith(
-                "https://selca.kastden.org/noona/group/"
-            ), item
-        else:
-            assert item["urls"][1].startswith(
-                "https://selca.kastden.org/noona/idol/"
-            ), item
-        if len(item["urls"]) > 2:
-            assert item["urls"][2].startswith("https://namu.wiki/w/"), item
-
-    @classmethod
-    def validate_unique_fields(cls, items: Sequence[Mapping], fields: list[str]):
-        seen = dict((field, dict()) for field in fields)
-        for item in items:
-            for field in fields:
-                value = item[field]
-                assert value not in seen[field], (item, seen[field][value])
-                seen[field][value] = item
-
-    @classmethod
-    def validate_all(cls, items: Sequence[Mapping]):
-        for item in items:
-            cls.validate(item)
-        # TODO: validate id cross-reference?
-        cls.validate_unique_fields(items, cls.UNIQUE_FIELDS + ["id"])
-
 
 class IdolValidator(Validator):
+    SCHEMA = Idol
     REQUIRED_FIELDS = [
         "name",
         "name_original",
@@ -170,6 +132,17 @@ class IdolValidator(Validator):
     ]
     OPTIONAL_FIELDS = ["name_alias", "debut_date", "height", "weight", "thumb_url"]
     OTHER_FIELDS = ["groups"]
+    PATTERNS = {
+        "id": ID_PATTERN,
+        "birth_date": DATE_PATTERN,
+        "debut_date": DATE_PATTERN,
+        "thumb_url": THUMB_URL_PATTERN,
+    }
+    URL_PATTERNS = [
+        KPOPNET_URL_PATTERN,
+        r"https://selca\.kastden\.org/noona/idol/.+",
+        NAMU_URL_PATTERN,
+    ]
 
     @classmethod
     def gen_id(cls, item: Idol) -> str:
@@ -177,6 +150,7 @@ class IdolValidator(Validator):
 
 
 class GroupValidator(Validator):
+    SCHEMA = Group
     REQUIRED_FIELDS = ["name", "name_original", "agency_name", "urls"]
     OPTIONAL_FIELDS = [
         "name_alias",
@@ -187,6 +161,18 @@ class GroupValidator(Validator):
     ]
     OTHER_FIELDS = ["members"]
     UNIQUE_FIELDS = ["name", "name_original"]
+    PATTERNS = {
+        "id": ID_PATTERN,
+        "parent_id": ID_PATTERN,
+        "debut_date": DATE_PATTERN,
+        "disband_date": DATE_PATTERN,
+        "thumb_url": THUMB_URL_PATTERN,
+    }
+    URL_PATTERNS = [
+        KPOPNET_URL_PATTERN,
+        r"https://selca\.kastden\.org/noona/group/.+",
+        NAMU_URL_PATTERN,
+    ]
 
     @classmethod
     def gen_id(cls, item: Group) -> str:
@@ -0,0 +1,84 @@
+from .items import Idol, Group, GroupMember, Profiles
+
+VISITING = 1
+DONE = 2
+
+
+# ID breaks ties so order doesn't depend on crawl order
+def idol_key(idol: Idol):
+    return (idol["birth_date"], idol["real_name"], idol["id"])
+
+
+def group_key(group: Group):
+    return (group["debut_date"] or "0", group["name"], group["id"])
+
+
+def link_profiles(idols: list[Idol], groups: list[Group]) -> Profiles:
+    """Sort profiles and resolve references between them.
+
+    Idols should have temporary `_groups` key with kastden group URLs, groups
+    may have kastden URL of the main group in `parent_id`. Lists are sorted and
+    items are modified *in place*, no copies are made. All references are
+    checked and every index is built once, so it's linear in the number of
+    idols, groups and memberships.
+    """
+    idols.sort(key=idol_key, reverse=True)
+    groups.sort(key=group_key, reverse=True)
+
+    group_by_id: dict[str, Group] = {}
+    # XXX: second url is kastden
+    group_by_url: dict[str, Group] = {}
+    for group in groups:
+        assert group["id"] not in group_by_id, ("duplicate group", group)
+        group_by_id[group["id"]] = group
+        group_by_url[group["urls"][1]] = group
+        group["members"] = []
+    idol_groups_key = lambda gid: group_key(group_by_id[gid])
+
+    membership: dict[tuple[str, str], GroupMember] = {}
+    for idol in idols:
+        idol["groups"] = []
+        for idol_group in idol.pop("_groups"):
+            group = group_by_url.get(idol_group["url"])
+            assert group, ("unknown group", idol_group, idol)
+            key = (group["id"], idol["id"])
+            assert key not in membership, ("duplicate member", idol, group)
+            member: GroupMember = {
+                "idol_id": idol["id"],
+                "current": idol_group["current"],
+                "roles": idol_group["roles"],
+            }
+            membership[key] = member
+            idol["groups"].append(group["id"])
+            group["members"].append(member)
+        idol["groups"].sort(key=idol_groups_key, reverse=True)
+
+    for group in groups:
+        if group["parent_id"]:
+            parent_group = group_by_url.get(group["parent_id"])
+            assert parent_group, ("unknown parent group", group)
+            group["parent_id"] = parent_group["id"]
+
+    # Subunits don't have info about current members, copy from main group.
+    # Main groups are fixed first so nested subunits get final values.
+    state: dict[str, int] = {}
+    for group in groups:
+        chain: list[Group] = []
+        while state.get(group["id"]) != DONE:
+            assert state.get(group["id"]) != VISITING, ("parent cycle", chain)
+            state[group["id"]] = VISITING
+            chain.append(group)
+            if not group["parent_id"]:
+                break
+            group = group_by_id[group["parent_id"]]
+        for group in reversed(chain):
+            if group["parent_id"]:
+                for member in group["members"]:
+                    parent_member = membership.get(
+                        (group["parent_id"], member["idol_id"])
+                    )
+                    assert parent_member, ("not in main group", member, group)
+                    member["current"] = parent_member["current"]
+            state[group["id"]] = DONE
+
+    return {"idols": idols, "groups": groups}
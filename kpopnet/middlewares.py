@@ -0,0 +1,133 @@
+import time
+from weakref import WeakKeyDictionary
+
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+
+# Sent by CallbackTimerMiddleware with callback (name) and seconds arguments
+callback_done = object()
+
+
+class CallbackTimerMiddleware:
+    """Spider middleware measuring time from callback start to its last output.
+
+    Should be the closest one to the spider to see raw callback output.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.started: WeakKeyDictionary = WeakKeyDictionary()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_spider_input(self, response, spider):
+        self.started[response] = time.perf_counter()
+
+    def process_spider_output(self, response, result, spider):
+        try:
+            yield from result
+        finally:
+            self.done(response)
+
+    async def process_spider_output_async(self, response, result, spider):
+        try:
+            async for r in result:
+                yield r
+        finally:
+            self.done(response)
+
+    def done(self, response):
+        start = self.started.pop(response, None)
+        if start is None:
+            return
+        # default callback is spider's parse()
+        callback = response.request.callback
+        self.crawler.signals.send_catch_log(
+            callback_done,
+            callback=callback.__name__ if callback else "parse",
+            seconds=time.perf_counter() - start,
+        )
+
+
+class AdaptiveThrottleMiddleware:
+    """Downloader middleware adjusting per-slot delay and concurrency.
+
+    Latency and error rate of every slot are tracked as moving averages.
+    Every error (connection failure, 429, 5xx) halves concurrency and doubles
+    delay once; while error rate stays above the limit, successes keep
+    current settings. Otherwise responses faster than target latency grow
+    concurrency by one per round of successful requests and shrink delay.
+    Slower responses move delay towards latency / concurrency.
+
+    Should be the closest one to the downloader so cached responses and
+    retries don't affect measurements.
+    """
+
+    ERROR_CODES = {429, 500, 502, 503, 504, 522, 524}
+    # weight of a new sample in moving averages
+    ALPHA = 0.2
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.min_delay = settings.getfloat("DOWNLOAD_DELAY")
+        self.max_delay = settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY")
+        self.max_concurrency = settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY")
+        self.target_latency = settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY")
+        self.max_error_rate = settings.getfloat("ADAPTIVE_THROTTLE_MAX_ERROR_RATE")
+        # slot key -> [latency, error rate, successes since last change]
+        self.slots: dict[str, list] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        return cls(crawler)
+
+    def process_response(self, request, response, spider):
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.update(request, latency, response.status in self.ERROR_CODES)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if not isinstance(exception, IgnoreRequest):
+            self.update(request, None, True)
+
+    def update(self, request, latency, error: bool):
+        key = request.meta.get("download_slot")
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return
+        if key not in self.slots:
+            self.slots[key] = [latency or 0.0, 0.0, 0]
+        stats = self.slots[key]
+        if latency is not None:
+            stats[0] += self.ALPHA * (latency - stats[0])
+        stats[1] += self.ALPHA * (error - stats[1])
+        avg_latency, error_rate, successes = stats
+
+        if error:
+            slot.concurrency = max(1, slot.concurrency // 2)
+            slot.delay = min(self.max_delay, max(slot.delay * 2, self.min_delay, 0.1))
+            stats[2] = 0
+        elif error_rate > self.max_error_rate:
+            # recent errors are already backed off, just don't speed up yet
+            stats[2] = 0
+        elif avg_latency > self.target_latency:
+            delay = avg_latency / slot.concurrency
+            slot.delay = min(self.max_delay, max(self.min_delay, delay))
+            stats[2] = 0
+        else:
+            slot.delay = max(self.min_delay, slot.delay * 0.9)
+            stats[2] = successes = successes + 1
+            if successes >= slot.concurrency:
+                slot.concurrency = min(self.max_concurrency, slot.concurrency + 1)
+                stats[2] = 0
+
+        prefix = f"throttle/{key}"
+        self.crawler.stats.set_value(f"{prefix}/delay", slot.delay)
+        self.crawler.stats.set_value(f"{prefix}/concurrency", slot.concurrency)
+        self.crawler.stats.set_value(f"{prefix}/latency", avg_latency)
+        self.crawler.stats.set_value(f"{prefix}/error_rate", error_rate)
@@ -0,0 +1,63 @@
+"""Newline-delimited JSON, one idol or group record per line.
+
+idols.ndjson and groups.ndjson hold the same records in the same order as
+kpopnet.json, so they can be processed one at a time at constant memory
+instead of parsing the whole document first.
+"""
+
+import json
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Union, cast
+
+from .dump import atomic_open
+from .items import Idol, Group
+
+DEFAULT_IDOLS_FPATH = Path(__file__).parent / ".." / "idols.ndjson"
+DEFAULT_GROUPS_FPATH = Path(__file__).parent / ".." / "groups.ndjson"
+
+
+def dump_ndjson(items: Iterable, fpath: Path):
+    with atomic_open(fpath) as f:
+        for item in items:
+            line = json.dumps(
+                item, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+            )
+            f.write(line + "\n")
+
+
+def read_ndjson(
+    fpath: Union[str, Path],
+    fields: Optional[list[str]] = None,
+    where: Optional[Callable[[dict], bool]] = None,
+) -> Iterator[dict]:
+    """Yield records one by one.
+
+    Records not matching where predicate are skipped, fields limits keys of
+    yielded records (predicate still gets full record).
+    """
+    with open(fpath, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if where is not None and not where(record):
+                continue
+            if fields is not None:
+                record = dict((field, record[field]) for field in fields)
+            yield record
+
+
+def iter_idols(
+    fpath: Union[str, Path] = DEFAULT_IDOLS_FPATH,
+    fields: Optional[list[str]] = None,
+    where: Optional[Callable[[Idol], bool]] = None,
+) -> Iterator[Idol]:
+    return cast(Iterator[Idol], read_ndjson(fpath, fields, where))  # type: ignore
+
+
+def iter_groups(
+    fpath: Union[str, Path] = DEFAULT_GROUPS_FPATH,
+    fields: Optional[list[str]] = None,
+    where: Optional[Callable[[Group], bool]] = None,
+) -> Iterator[Group]:
+    return cast(Iterator[Group], read_ndjson(fpath, fields, where))  # type: ignore
@@ -0,0 +1,71 @@
+import re
+from typing import Optional, Sequence
+
+from .items import Override
+
+URLS_KEY_RE = re.compile(r"urls\[(\d+)\]")
+
+
+def freeze(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class CompiledOverride:
+    __slots__ = ("pos", "override", "fields", "urls", "hits")
+
+    def __init__(self, pos: int, override: Override):
+        self.pos = pos
+        self.override = override
+        self.fields = {}
+        self.urls: list[tuple[int, str]] = []
+        self.hits = 0
+        for key, value in override["update"].items():
+            m = URLS_KEY_RE.fullmatch(key)
+            if m:
+                # urls[x] -> x, kpopnet url is inserted after overrides
+                self.urls.append((int(m.group(1)) - 1, value))
+            else:
+                self.fields[key] = value
+
+    def apply(self, item: dict):
+        for idx, url in self.urls:
+            item["urls"][idx] = url
+        item.update(self.fields)
+        self.hits += 1
+
+
+# Overrides indexed by the tuple of their match fields, so lookup costs one
+# dict probe per distinct set of match keys instead of scanning all overrides.
+# Overrides matching by "id" are looked up after ID generation.
+class OverrideIndex:
+    def __init__(self, overrides: Sequence[Override]):
+        self.compiled: list[CompiledOverride] = []
+        self.by_fields: dict[tuple[str, ...], dict[tuple, CompiledOverride]] = {}
+        self.by_id: dict[tuple[str, ...], dict[tuple, CompiledOverride]] = {}
+        for pos, override in enumerate(overrides):
+            compiled = CompiledOverride(pos, override)
+            self.compiled.append(compiled)
+            match = override["match"]
+            assert match, override
+            keys = tuple(sorted(match))
+            tables = self.by_id if "id" in match else self.by_fields
+            values = tuple(freeze(match[key]) for key in keys)
+            # first override wins, same as in file order
+            tables.setdefault(keys, {}).setdefault(values, compiled)
+
+    def find(self, item: dict, by_id=False) -> Optional[CompiledOverride]:
+        found = None
+        for keys, table in (self.by_id if by_id else self.by_fields).items():
+            values = tuple(freeze(item.get(key)) for key in keys)
+            compiled = table.get(values)
+            if compiled and (found is None or compiled.pos < found.pos):
+                found = compiled
+        return found
+
+    def apply(self, item: dict, by_id=False):
+        compiled = self.find(item, by_id)
+        if compiled:
+            compiled.apply(item)
+
+    def unmatched(self) -> list[Override]:
+        return [c.override for c in self.compiled if not c.hits]
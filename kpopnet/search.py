@@ -0,0 +1,216 @@
+"""Name search index over idols and groups.
+
+Every name is indexed under several keys:
+
+    n  normalized name (NFKC, casefolded, alphanumerics only)
+    r  romanization key, variants like eo/u, g/k, r/l, ee/i collapse together
+    j  Hangul decomposed to jamo, so partially typed syllables match
+    i  Hangul initial consonants (초성), e.g. ㅈㅂㄹ for 전보람
+
+Keys are split into bigrams (plus "^" + first char to allow one-character
+prefix queries) and posting lists of key indexes are stored per bigram.
+Query probes posting lists of its rarest bigrams and checks only candidate
+keys, no full scan is made.
+"""
+
+import json
+import unicodedata
+from pathlib import Path
+from typing import Iterator, Union
+
+from .db import normalize_name
+from .dump import atomic_open
+from .items import Profiles
+
+DEFAULT_FPATH = Path(__file__).parent / ".." / "kpopnet.search.json"
+VERSION = 1
+
+# in order of importance
+FIELDS = ["name", "name_original", "real_name", "real_name_original", "name_alias"]
+
+ROMANIZATION_RULES = [
+    ("eo", "u"),
+    ("eu", "u"),
+    ("oo", "u"),
+    ("ee", "i"),
+    ("ae", "e"),
+    ("ch", "j"),
+    ("sh", "s"),
+    ("g", "k"),
+    ("d", "t"),
+    ("b", "p"),
+    ("r", "l"),
+]
+
+HANGUL_BASE = 0xAC00
+HANGUL_LAST = 0xD7A3
+# compatibility jamo, as typed from keyboard
+INITIALS = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+MEDIALS = "ㅏㅐㅑㅒㅓㅔㅕㅖㅗㅘㅙㅚㅛㅜㅝㅞㅟㅠㅡㅢㅣ"
+FINALS = " ㄱㄲㄳㄴㄵㄶㄷㄹㄺㄻㄼㄽㄾㄿㅀㅁㅂㅄㅅㅆㅇㅈㅊㅋㅌㅍㅎ"
+# NFKC turns compatibility jamo into conjoining ones, revert that
+JAMO_MAP = dict(
+    (ord(unicodedata.normalize("NFKC", c)), c)
+    for c in set(INITIALS + MEDIALS + FINALS.strip())
+)
+
+
+def normalize(name: str) -> str:
+    return normalize_name(name).translate(JAMO_MAP)
+
+
+def is_hangul(c: str) -> bool:
+    return HANGUL_BASE <= ord(c) <= HANGUL_LAST
+
+
+def romanization_key(name: str) -> str:
+    for src, dst in ROMANIZATION_RULES:
+        name = name.replace(src, dst)
+    # doubled consonants: "kk" -> "k"
+    return "".join(c for n, c in enumerate(name) if n == 0 or c != name[n - 1])
+
+
+def to_jamo(name: str) -> str:
+    result = []
+    for c in name:
+        if is_hangul(c):
+            code = ord(c) - HANGUL_BASE
+            result.append(INITIALS[code // 588])
+            result.append(MEDIALS[code // 28 % 21])
+            if code % 28:
+                result.append(FINALS[code % 28])
+        else:
+            result.append(c)
+    return "".join(result)
+
+
+def to_initials(name: str) -> str:
+    return "".join(
+        INITIALS[(ord(c) - HANGUL_BASE) // 588] for c in name if is_hangul(c)
+    )
+
+
+def name_keys(name: str) -> Iterator[tuple[str, str]]:
+    """Yield (type, key) pairs of normalized name."""
+    yield "n", name
+    if any(c.isascii() for c in name):
+        yield "r", romanization_key(name)
+    if any(is_hangul(c) for c in name):
+        yield "j", to_jamo(name)
+        yield "i", to_initials(name)
+
+
+def query_keys(query: str) -> Iterator[tuple[str, str]]:
+    query = normalize(query)
+    if query and all(c in INITIALS for c in query):
+        yield "i", query
+        return
+    for ktype, key in name_keys(query):
+        if ktype != "i":
+            yield ktype, key
+
+
+def bigrams(ktype: str, key: str) -> set[str]:
+    grams = set([ktype + "^" + key[:1]])
+    grams.update(ktype + key[n : n + 2] for n in range(len(key) - 1))
+    return grams
+
+
+def query_bigrams(ktype: str, key: str) -> set[str]:
+    # prefix gram only for one-character query, otherwise it's a substring
+    if len(key) == 1:
+        return set([ktype + "^" + key])
+    return set(ktype + key[n : n + 2] for n in range(len(key) - 1))
+
+
+def item_names(item: dict) -> Iterator[tuple[int, str]]:
+    for rank, field in enumerate(FIELDS):
+        value = item.get(field)
+        if not value:
+            continue
+        # aliases are joined with ", " by parse_name_alias
+        for name in value.split(", ") if field == "name_alias" else [value]:
+            yield rank, name
+
+
+def build_search(profiles: Profiles) -> dict:
+    docs: list[list[str]] = []
+    keys: list[list] = []  # [doc, field rank, type, key]
+    seen: set[tuple[int, str, str]] = set()
+    grams: dict[str, list[int]] = {}
+    for kind in ("idols", "groups"):
+        for item in profiles[kind]:  # type: ignore
+            doc = len(docs)
+            docs.append([kind, item["id"]])
+            for rank, name in item_names(item):
+                name = normalize(name)
+                if not name:
+                    continue
+                for ktype, key in name_keys(name):
+                    # same key from less important field is useless
+                    if (doc, ktype, key) in seen:
+                        continue
+                    seen.add((doc, ktype, key))
+                    for gram in sorted(bigrams(ktype, key)):
+                        grams.setdefault(gram, []).append(len(keys))
+                    keys.append([doc, rank, ktype, key])
+    return {"version": VERSION, "docs": docs, "keys": keys, "grams": grams}
+
+
+def dump_search(profiles: Profiles, fpath: Path):
+    index = build_search(profiles)
+    with atomic_open(fpath) as f:
+        # same profiles must give same bytes, whatever the hash seed
+        json.dump(
+            index, f, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+
+
+class SearchIndex:
+    def __init__(self, data: dict):
+        assert data["version"] == VERSION, data["version"]
+        self.docs: list[list[str]] = data["docs"]
+        self.keys: list[list] = data["keys"]
+        self.grams: dict[str, list[int]] = data["grams"]
+
+    def candidates(self, ktype: str, key: str) -> list[int]:
+        postings = []
+        for gram in query_bigrams(ktype, key):
+            posting = self.grams.get(gram)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return list(result)
+
+    def search(self, query: str, limit: int = 20) -> list[tuple[str, str]]:
+        """Find idols and groups by (part of) name.
+
+        Returns (kind, id) pairs, best matches first: exact before prefix
+        before substring matches, then by field and key type.
+        """
+        best: dict[int, tuple] = {}
+        for order, (ktype, qkey) in enumerate(query_keys(query)):
+            if not qkey:
+                continue
+            for idx in self.candidates(ktype, qkey):
+                doc, rank, _, key = self.keys[idx]
+                pos = key.find(qkey)
+                if pos < 0:
+                    continue
+                quality = 0 if key == qkey else 1 if pos == 0 else 2
+                score = (quality, rank, order, len(key), doc)
+                if doc not in best or score < best[doc]:
+                    best[doc] = score
+        docs = sorted(best, key=best.__getitem__)[:limit]
+        return [(self.docs[doc][0], self.docs[doc][1]) for doc in docs]
+
+
+def load_search(fpath: Union[str, Path] = DEFAULT_FPATH) -> SearchIndex:
+    with open(fpath, encoding="utf-8") as f:
+        return SearchIndex(json.load(f))
@@ -44,21 +44,24 @@ ROBOTSTXT_OBEY = False
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-# SPIDER_MIDDLEWARES = {
-#    "kpopnet.middlewares.KpopnetSpiderMiddleware": 543,
-# }
+SPIDER_MIDDLEWARES = {
+    # closest to the spider to time raw callback output
+    "kpopnet.middlewares.CallbackTimerMiddleware": 1000,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    "kpopnet.middlewares.KpopnetDownloaderMiddleware": 543,
-# }
+DOWNLOADER_MIDDLEWARES = {
+    # closest to the downloader to see only real downloads
+    "kpopnet.middlewares.AdaptiveThrottleMiddleware": 990,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-# }
+EXTENSIONS = {
+    # "scrapy.extensions.telnet.TelnetConsole": None,
+    "kpopnet.extensions.CrawlMetrics": 500,
+}
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -85,7 +88,10 @@ HTTPCACHE_ENABLED = True
 HTTPCACHE_EXPIRATION_SECS = 0
 # HTTPCACHE_DIR = "httpcache"
 # HTTPCACHE_IGNORE_HTTP_CODES = []
-# HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+# Single compressed file .scrapy/httpcache/<spider>.sqlite
+HTTPCACHE_STORAGE = "kpopnet.httpcache.SqliteCacheStorage"
+# Remove entries not reached by the last full crawl
+HTTPCACHE_PRUNE = True
 
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
@@ -97,3 +103,34 @@ LOG_LEVEL = "INFO"
 CLOSESPIDER_ERRORCOUNT = 1
 DOWNLOAD_DELAY = 0.1
 # CONCURRENT_REQUESTS = 1
+# Initial per-slot concurrency, adjusted by AdaptiveThrottleMiddleware
+CONCURRENT_REQUESTS_PER_DOMAIN = 4
+# Profile pages and thumbnails (own "thumbs" slot) are throttled separately
+CONCURRENT_REQUESTS = 32
+
+# Per-slot delay/concurrency adapt to latency and error rate, DOWNLOAD_DELAY
+# is the lower bound for delay
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 1.0
+ADAPTIVE_THROTTLE_MAX_ERROR_RATE = 0.1
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 16
+ADAPTIVE_THROTTLE_MAX_DELAY = 10.0
+
+# Finished pages are saved every CHECKPOINT_INTERVAL seconds (0 = only on
+# error) to .scrapy/<spider>/checkpoint.json, continue with --resume
+CHECKPOINT_INTERVAL = 60.0
+
+# Worker processes for HTML parsing (0 = parse in reactor thread)
+PARSE_WORKERS = 0
+
+# Thread pool size for thumbnail decoding/hashing/writing
+THUMB_WORKERS = 4
+# Resized thumbnail variants, built with process pool (0 = CPU count)
+THUMB_SIZES = [64, 128, 256]
+THUMB_FORMATS = ["jpg", "webp"]
+THUMB_BUILD_WORKERS = 0
+
+# Crawl metrics are written every METRICS_INTERVAL seconds (0 = disabled),
+# to .scrapy/<spider>/metrics.json by default, Prometheus format if *.prom
+METRICS_INTERVAL = 10.0
+# METRICS_FILE = "metrics.prom"
@@ -0,0 +1,52 @@
+"""Parser throughput on saved pages, without network and Scrapy engine.
+
+Usage: python -m kpopnet.spiders.bench_kastden [seconds per fixture]
+"""
+
+import sys
+import time
+import warnings
+from pathlib import Path
+
+from scrapy.http import HtmlResponse, Request
+
+from .kastden import KastdenSpider
+
+# same pages as used by tests
+FIXTURES_DPATH = Path(__file__).parent / "fixtures"
+KASTDEN_URL = "https://selca.kastden.org/noona/"
+
+
+def load_fixtures() -> list[tuple[str, bytes]]:
+    return [(f.name, f.read_bytes()) for f in sorted(FIXTURES_DPATH.glob("*.html"))]
+
+
+def bench(spider: KastdenSpider, name: str, body: bytes, duration: float) -> float:
+    kind, slug = name.removesuffix(".html").split("_", 1)
+    url = f"{KASTDEN_URL}{kind}/{slug}/"
+    parse = spider.parse_idol_page if kind == "idol" else spider.parse_group_page
+    pages = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < duration:
+        # fresh response each time so selector isn't cached
+        response = HtmlResponse(url, body=body, encoding="utf-8", request=Request(url))
+        parse(response)
+        pages += 1
+    return pages / elapsed
+
+
+def main():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    spider = KastdenSpider()
+    total = 0.0
+    fixtures = load_fixtures()
+    for name, body in fixtures:
+        rate = bench(spider, name, body, duration)
+        total += 1 / rate
+        print(f"{name:<24} {rate:10.1f} pages/sec")
+    print(f"{'mean':<24} {len(fixtures) / total:10.1f} pages/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,97 @@
-import os
 import re
-import io
+import sys
 import json
-import hashlib
+import asyncio
+import multiprocessing
 from pathlib import Path
 from urllib.parse import unquote
-from typing import cast
-from contextlib import suppress
+from typing import Optional, cast
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 import scrapy
-from scrapy.http import Response
-from PIL import Image
+from scrapy import signals
+from scrapy.http import HtmlResponse, Response
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.project import data_path
+from twisted.internet import task
 
 from ..items import (
     Idol,
     Group,
     Profiles,
     Overrides,
+    ThumbVariants,
     IdolValidator,
     GroupValidator,
 )
-from ..utils import find_by_field
+from ..binary import dump_binary
+from ..delta import dump_delta, load_release
+from ..dump import atomic_open, dump_json
+from ..entities import dump_entities
+from ..link import link_profiles
+from ..ndjson import dump_ndjson
+from ..overrides import OverrideIndex
+from ..search import dump_search
+from ..state import CrawlState, Kind
+from ..thumbs import ThumbProcessor, build_all_variants
+from ..utils import (
+    FieldTable,
+    FingerprintSet,
+    StageTimer,
+    page_fingerprint,
+    parse_shard,
+)
+from ..validate import validate_profiles
 
+DATE_RE = re.compile(r"(\d{4})\s*-\s*(\d{2})\s*-\s*(\d{2})")
+PARTIAL_DATE_RE = re.compile(r"(\d{4})(?:\s*-\s*(\d{2})(?:\s*-\s*(\d{2}))?)?")
+HEIGHT_RE = re.compile(r"(\d+(?:\.\d+)?)cm")
+WEIGHT_RE = re.compile(r"(\d+(?:\.\d+)?)kg")
+NATIVE_NAME_RE = re.compile(r"\s*\(.*\)$")
+ALIAS_OPEN_RE = re.compile(r"\s*\(\s*")
+ALIAS_CLOSE_RE = re.compile(r"\s*\)\s*")
+ALIAS_TRAILING_RE = re.compile(r",+$")
+ALIAS_SEP_RE = re.compile(r"\s*,+\s*")
 
-class KastdenSpider(scrapy.Spider):
-    name = "kastden"
-    allowed_domains = ["selca.kastden.org"]
-    start_urls = ["https://selca.kastden.org/noona/search/?pt=kpop"]
 
-    all_idols: list[Idol] = []
-    all_groups: list[Group] = []
-    all_overrides: Overrides
+class KastdenParser:
+    """Parsing of kastden pages into raw items.
 
-    OUT_JSON_FNAME = "kpopnet.json"
-    OUT_MINJSON_FNAME = "kpopnet.min.json"
-    OUT_THUMB_DNAME = "thumb"
-
-    THUMB_BASE_URL = "https://up.kpop.re/net"
+    Has no crawl state, so the same code runs in the spider and in parsing
+    worker processes.
+    """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        project_root_fpath = Path(__file__).parent / ".." / ".."
-
-        self.out_json_fpath = project_root_fpath / self.OUT_JSON_FNAME
-        self.out_minjson_fpath = project_root_fpath / self.OUT_MINJSON_FNAME
-        self.out_thumb_dpath = project_root_fpath / self.OUT_THUMB_DNAME
-
-        overrides_fpath = project_root_fpath / "overrides.json"
-        self.all_overrides = json.load(open(overrides_fpath))
-
-        self.cleanup()
-
-    def cleanup(self):
-        with suppress(FileNotFoundError):
-            os.remove(self.out_json_fpath)
-        with suppress(FileNotFoundError):
-            os.remove(self.out_minjson_fpath)
+        # TODO: other fields: hometown, country
+        # TODO: additional fields? name_kanji, real_name_hanja
+        keep = lambda prop, value: value
+        intern = lambda prop, value: sys.intern(value)
+        partial_date = partial(self.parse_date, full=False)
+        self.idol_fields = FieldTable(
+            [
+                (r"^pop\s+type$", None, self.check_pop_type),
+                (r"stage\s+name.*romanized", "name", keep),
+                (r"stage\s+name.*original", "name_original", self.strip_native),
+                (r"formerly\s+known\s+as", "name_alias", self.parse_alias_prop),
+                (r"real\s+name.*romanized", "real_name", keep),
+                (r"real\s+name.*original", "real_name_original", self.strip_native),
+                (r"birth\s+date", "birth_date", self.parse_date),
+                (r"debut\s+date", "debut_date", partial_date),
+                (r"height", "height", self.parse_height),
+                (r"weight", "weight", self.parse_weight),
+            ]
+        )
+        self.group_fields = FieldTable(
+            [
+                (r"display\s+name.*romanized", "name", keep),
+                (r"display\s+name.*original", "name_original", keep),
+                (r"company", "agency_name", intern),
+                (r"debut\s+date", "debut_date", partial_date),
+                (r"disbandment\s+date", "disband_date", partial_date),
+            ]
+        )
 
     @staticmethod
     def unquote(url: str) -> str:
@@ -63,51 +99,62 @@ class KastdenSpider(scrapy.Spider):
         # for convenient ctrl+click from terminal
         return url.replace(" ", "%20")
 
-    def parse(self, response):
-        for href in response.css(".cell_line a::attr(href)").getall():
-            if href.startswith("/noona/idol/"):
-                yield response.follow(href, callback=self.parse_idol)
-
     def parse_date(self, prop, value, full=True):
-        if full:
-            m = re.search(r"(\d{4})\s*-\s*(\d{2})\s*-\s*(\d{2})", value)
-        else:
-            m = re.search(r"(\d{4})(?:\s*-\s*(\d{2})(?:\s*-\s*(\d{2}))?)?", value)
+        m = (DATE_RE if full else PARTIAL_DATE_RE).search(value)
         assert m, (prop, value)
         year, month, day = m.groups()
         month = month or "01"
         day = day or "01"
         return f"{year}-{month}-{day}"
 
-    def download_thumb(self, response: Response, item: Idol | Group):
-        thumb_url = response.css(".thumb img::attr(src)").get()
-        if not thumb_url:
-            return  # optional
-        assert thumb_url.endswith(".jpg"), thumb_url
-        # Callbacks are better than await here because we can download
-        # everything asynchonously
-        yield response.follow(
-            thumb_url, callback=self.write_thumb, cb_kwargs=dict(item=item)
-        )
-
-    def write_thumb(self, response: Response, item: Idol | Group):
-        im = Image.open(io.BytesIO(response.body))
-        assert im.format == "JPEG", item
-        hash = hashlib.sha1(response.body).hexdigest()
-        fname = hash[:2] + "/" + hash[2:] + ".jpg"
-        fpath = self.out_thumb_dpath / fname
-        os.makedirs(fpath.parent, exist_ok=True)
-        fpath.write_bytes(response.body)
-        item["thumb_url"] = self.THUMB_BASE_URL + "/" + fname
-
     def parse_name_alias(self, value: str) -> str:
-        value = re.sub(r"\s*\(\s*", ",", value)
-        value = re.sub(r"\s*\)\s*", ",", value)
-        value = re.sub(r",+$", "", value)
-        value = re.sub(r"\s*,+\s*", ", ", value)
+        value = ALIAS_OPEN_RE.sub(",", value)
+        value = ALIAS_CLOSE_RE.sub(",", value)
+        value = ALIAS_TRAILING_RE.sub("", value)
+        value = ALIAS_SEP_RE.sub(", ", value)
         return value
 
-    def parse_idol(self, response):
+    def parse_alias_prop(self, prop: str, value: str) -> str:
+        return self.parse_name_alias(value)
+
+    def check_pop_type(self, prop: str, value: str):
+        assert value == "K-pop", (prop, value)
+
+    def strip_native(self, prop: str, value: str) -> str:
+        return NATIVE_NAME_RE.sub("", value)  # remove kanji/hanja name
+
+    def parse_height(self, prop: str, value: str) -> float:
+        m = HEIGHT_RE.search(value)
+        assert m, (prop, value)
+        return float(m.group(1))
+
+    def parse_weight(self, prop: str, value: str) -> float:
+        m = WEIGHT_RE.search(value)
+        assert m, (prop, value)
+        return float(m.group(1))
+
+    def parse_props(self, table, fields: FieldTable, item: dict):
+        # Walk lxml tree directly, selector per cell is much slower
+        for tr in table.root.iter("tr"):
+            tds = tr.findall("td")
+            if len(tds) < 2:
+                continue
+            prop = tds[0].text
+            if not prop:
+                continue
+            prop = prop.strip()
+            entry = fields.lookup(prop)
+            if not entry:
+                continue
+            value = "".join(tds[1].itertext()).strip()
+            if not value:
+                continue
+            field, parse = entry
+            value = parse(prop, value)
+            if field:
+                item[field] = value
+
+    def parse_idol_page(self, response) -> Idol:
         """
         Pop type: K-pop
         Stage name (romanized): Boram
@@ -126,44 +173,7 @@ class KastdenSpider(scrapy.Spider):
         """
         idol = cast(Idol, {})
         table_idol = response.css("h1 ~ div table")[0]
-        for tr in table_idol.css("tr"):
-            prop = tr.css("td:nth-child(1)::text").get()
-            if not prop:
-                continue
-            prop = prop.strip()
-            value = tr.css("td:nth-child(2) ::text").getall()
-            value = "".join(value).strip()
-            if not value:
-                continue
-
-            # TODO: other fields: formerly known as, hometown, country
-            # TODO: additional fields? name_kanji, real_name_hanja
-            if prop == "Pop type":
-                assert value == "K-pop", (prop, value)
-            elif re.search(r"stage\s+name.*romanized", prop, re.I):
-                idol["name"] = value
-            elif re.search(r"stage\s+name.*original", prop, re.I):
-                value = re.sub(r"\s*\(.*\)$", "", value)  # remove kanji name
-                idol["name_original"] = value
-            elif re.search(r"formerly\s+known\s+as", prop, re.I):
-                idol["name_alias"] = self.parse_name_alias(value)
-            elif re.search(r"real\s+name.*romanized", prop, re.I):
-                idol["real_name"] = value
-            elif re.search(r"real\s+name.*original", prop, re.I):
-                value = re.sub(r"\s*\(.*\)$", "", value)  # remove hanja name
-                idol["real_name_original"] = value
-            elif re.search(r"birth\s+date", prop, re.I):
-                idol["birth_date"] = self.parse_date(prop, value)
-            elif re.search(r"debut\s+date", prop, re.I):
-                idol["debut_date"] = self.parse_date(prop, value, full=False)
-            elif re.search(r"height", prop, re.I):
-                m = re.search(r"(\d+(?:\.\d+)?)cm", value)
-                assert m, (prop, value)
-                idol["height"] = float(m.group(1))
-            elif re.search(r"weight", prop, re.I):
-                m = re.search(r"(\d+(?:\.\d+)?)kg", value)
-                assert m, (prop, value)
-                idol["weight"] = float(m.group(1))
+        self.parse_props(table_idol, self.idol_fields, cast(dict, idol))
 
         idol["_groups"] = []  # tmp key, will update later
         for table_groups in response.css("h2 ~ table tbody"):  # groups + subunits
@@ -171,6 +181,8 @@ class KastdenSpider(scrapy.Spider):
                 tds = tr.css("td")
                 # group_name = tds[1].css("a::text").get()
                 group_url = response.urljoin(tds[1].css("a::attr(href)").get())
+                # same few group URLs/roles are repeated in every member
+                group_url = sys.intern(group_url)
                 if len(tds) >= 5:
                     group_disbanded = tds[4].get() is not None
                     group_current = not group_disbanded
@@ -182,14 +194,11 @@ class KastdenSpider(scrapy.Spider):
                 group_roles = None
                 if len(tds) >= 7:
                     roles_text = tds[6].css("::text").get()
-                    group_roles = roles_text.lower() if roles_text else None
+                    if roles_text:
+                        group_roles = sys.intern(roles_text.lower())
                 idol["_groups"].append(
                     {"url": group_url, "current": group_current, "roles": group_roles}
                 )
-                # TODO(Kagami): does crawl deduplication always work?
-                yield response.follow(group_url, callback=self.parse_group)
-
-        yield from self.download_thumb(response, idol)
 
         idol["urls"] = [response.url]
         list_urls = response.css("h2 ~ ul")
@@ -207,10 +216,23 @@ class KastdenSpider(scrapy.Spider):
             if namu_urls:
                 idol["urls"].append(namu_urls[0])
 
-        IdolValidator.normalize(cast(dict, idol), self.all_overrides["idols"])
-        self.all_idols.append(idol)
+        return idol
 
-    def parse_group(self, response):
+    def parse_thumb_url(self, response) -> Optional[str]:
+        thumb_url = response.css(".thumb img::attr(src)").get()
+        if thumb_url:
+            assert thumb_url.endswith(".jpg"), thumb_url
+        return thumb_url
+
+    def parse_page(self, kind: Kind, response) -> tuple[dict, Optional[str]]:
+        """Return raw item and thumbnail URL (if any)."""
+        if kind == "idols":
+            item = cast(dict, self.parse_idol_page(response))
+        else:
+            item = cast(dict, self.parse_group_page(response))
+        return item, self.parse_thumb_url(response)
+
+    def parse_group_page(self, response) -> Group:
         """
         Display name (romanized): T-ara
         Display name (original): 티아라
@@ -219,26 +241,7 @@ class KastdenSpider(scrapy.Spider):
         """
         group = cast(Group, {})
         table_group = response.css("h1 ~ div table")[0]
-        for tr in table_group.css("tr"):
-            prop = tr.css("td:nth-child(1)::text").get()
-            if not prop:
-                continue
-            prop = prop.strip()
-            value = tr.css("td:nth-child(2) ::text").getall()
-            value = "".join(value).strip()
-            if not value:
-                continue
-
-            if re.search(r"display\s+name.*romanized", prop, re.I):
-                group["name"] = value
-            elif re.search(r"display\s+name.*original", prop, re.I):
-                group["name_original"] = value
-            elif re.search(r"company", prop, re.I):
-                group["agency_name"] = value
-            elif re.search(r"debut\s+date", prop, re.I):
-                group["debut_date"] = self.parse_date(prop, value, full=False)
-            elif re.search(r"disbandment\s+date", prop, re.I):
-                group["disband_date"] = self.parse_date(prop, value, full=False)
+        self.parse_props(table_group, self.group_fields, cast(dict, group))
 
         table_parent_group = response.xpath(
             "//h2[contains(text(), 'Main group')]/following-sibling::table[1]/tbody"
@@ -255,9 +258,8 @@ class KastdenSpider(scrapy.Spider):
 
             # subunits miss agency_name, copy from main group
             assert "agency_name" not in group, group
-            group["agency_name"] = tr_group.css("td:nth-child(3) ::text").get().strip()
-
-        yield from self.download_thumb(response, group)
+            agency_name = tr_group.css("td:nth-child(3) ::text").get().strip()
+            group["agency_name"] = sys.intern(agency_name)
 
         group["urls"] = [response.url]
         list_urls = response.css("h2 ~ ul")
@@ -268,63 +270,479 @@ class KastdenSpider(scrapy.Spider):
             if namu_urls:
                 group["urls"].append(namu_urls[0])
 
-        GroupValidator.normalize(cast(dict, group), self.all_overrides["groups"])
-        self.all_groups.append(group)
+        return group
+
+
+_parser: Optional[KastdenParser] = None
+
+
+def parse_page(
+    kind: Kind, url: str, body: bytes, encoding: str
+) -> tuple[dict, Optional[str]]:
+    """Entry point of parsing worker processes."""
+    global _parser
+    if _parser is None:
+        _parser = KastdenParser()
+    response = HtmlResponse(url, body=body, encoding=encoding)
+    return _parser.parse_page(kind, response)
+
+
+class KastdenSpider(KastdenParser, scrapy.Spider):
+    name = "kastden"
+    allowed_domains = ["selca.kastden.org"]
+    start_urls = ["https://selca.kastden.org/noona/search/?pt=kpop"]
+
+    thumbs: ThumbProcessor
+    parse_pool: Optional[ProcessPoolExecutor]
+    idol_overrides: OverrideIndex
+    group_overrides: OverrideIndex
+
+    OUT_JSON_FNAME = "kpopnet.json"
+    OUT_MINJSON_FNAME = "kpopnet.min.json"
+    OUT_BIN_FNAME = "kpopnet.bin"
+    OUT_SEARCH_FNAME = "kpopnet.search.json"
+    OUT_IDOLS_NDJSON_FNAME = "idols.ndjson"
+    OUT_GROUPS_NDJSON_FNAME = "groups.ndjson"
+    OUT_DELTA_FNAME = "kpopnet.delta.json"
+    OUT_MANIFEST_FNAME = "kpopnet.manifest.json"
+    OUT_THUMB_DNAME = "thumb"
+    OUT_ENTITIES_DNAME = "entities"
+    STATE_FNAME = "state.json"
+    REPORT_FNAME = "validation.json"
+    SHARD_STATE_FNAME = "state.{}-of-{}.json"
+    CHECKPOINT_FNAME = "checkpoint.json"
+    SHARD_CHECKPOINT_FNAME = "checkpoint.{}-of-{}.json"
+
+    THUMB_BASE_URL = "https://up.kpop.re/net"
+    # Thumbnails use their own downloader slot so they are throttled
+    # separately and never hold back profile pages, which also go first.
+    THUMB_SLOT = "thumbs"
+    THUMB_PRIORITY = -10
+
+    def __init__(
+        self,
+        *args,
+        incremental=False,
+        offline=False,
+        shard=None,
+        merge=0,
+        resume=False,
+        rebuild=False,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.offline = offline
+        # Shard crawls only its slice of idols and saves raw state, merge run
+        # crawls nothing and builds output from states of all N shards,
+        # rebuild run does the same from the state of the last crawl
+        if isinstance(shard, str):
+            shard = parse_shard(shard)
+        self.shard: Optional[tuple[int, int]] = shard
+        self.merge = int(merge)
+        self.rebuild = rebuild
+        self.crawling = not (merge or rebuild)
+        if not self.crawling:
+            self.start_urls = []
+        # Only full crawl reaches every page and thumbnail, cache entries it
+        # didn't use are stale and can be pruned after it succeeds. Offline
+        # replay reads a fixed snapshot and must leave it as is.
+        self.full_crawl = self.crawling and not (
+            incremental or shard or resume or offline
+        )
+        self.prune_cache = False
+        self.timer = StageTimer()
+        project_root_fpath = Path(__file__).parent / ".." / ".."
+
+        self.out_json_fpath = project_root_fpath / self.OUT_JSON_FNAME
+        self.out_minjson_fpath = project_root_fpath / self.OUT_MINJSON_FNAME
+        self.out_bin_fpath = project_root_fpath / self.OUT_BIN_FNAME
+        self.out_search_fpath = project_root_fpath / self.OUT_SEARCH_FNAME
+        self.out_idols_ndjson_fpath = project_root_fpath / self.OUT_IDOLS_NDJSON_FNAME
+        self.out_groups_ndjson_fpath = (
+            project_root_fpath / self.OUT_GROUPS_NDJSON_FNAME
+        )
+        self.out_delta_fpath = project_root_fpath / self.OUT_DELTA_FNAME
+        self.out_manifest_fpath = project_root_fpath / self.OUT_MANIFEST_FNAME
+        self.out_thumb_dpath = project_root_fpath / self.OUT_THUMB_DNAME
+        self.out_entities_dpath = project_root_fpath / self.OUT_ENTITIES_DNAME
+
+        overrides_fpath = project_root_fpath / "overrides.json"
+        all_overrides: Overrides = json.load(open(overrides_fpath))
+        self.idol_overrides = OverrideIndex(all_overrides["idols"])
+        self.group_overrides = OverrideIndex(all_overrides["groups"])
+
+        # URLs already followed, group pages are linked from every member
+        self.frontier = FingerprintSet()
+
+        # raw records of this run and of the previous one (incremental mode)
+        self.data_dpath = Path(data_path(self.name, createdir=True))
+        self.state_fpath = self.data_dpath / self.STATE_FNAME
+        self.checkpoint_fpath = self.data_dpath / self.CHECKPOINT_FNAME
+        if shard:
+            self.state_fpath = self.data_dpath / self.SHARD_STATE_FNAME.format(*shard)
+            checkpoint_fname = self.SHARD_CHECKPOINT_FNAME.format(*shard)
+            self.checkpoint_fpath = self.data_dpath / checkpoint_fname
+        self.state = CrawlState()
+        self.prev_state = CrawlState()
+        if incremental:
+            # shard states are merged into the main one, look up pages there
+            try:
+                self.prev_state = CrawlState.load(self.data_dpath / self.STATE_FNAME)
+            except FileNotFoundError:
+                self.logger.warning("No previous crawl state, doing full crawl")
+
+        # Finished pages of interrupted crawl, taken into state once reached
+        # again instead of being requested
+        self.resumed = CrawlState()
+        if resume:
+            try:
+                self.resumed = CrawlState.load(self.checkpoint_fpath)
+                self.log(f"Resuming with {len(self.resumed)} finished pages")
+            except FileNotFoundError:
+                self.logger.warning("No checkpoint, doing full crawl")
+        self.checkpoint_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.opened, signals.spider_opened)
+        return spider
+
+    def opened(self):
+        self.timer.start("crawl")
+        self.thumbs = ThumbProcessor(
+            self.out_thumb_dpath,
+            self.settings.getint("THUMB_WORKERS"),
+            self.crawler.stats,
+        )
+        # Selector work is CPU-bound, optionally move it off the reactor
+        workers = self.settings.getint("PARSE_WORKERS")
+        self.parse_pool = None
+        if workers:
+            mp_context = multiprocessing.get_context("spawn")
+            self.parse_pool = ProcessPoolExecutor(workers, mp_context=mp_context)
+        interval = self.settings.getfloat("CHECKPOINT_INTERVAL")
+        if interval and self.crawling:
+            self.checkpoint_task = task.LoopingCall(self.save_checkpoint)
+            self.checkpoint_task.start(interval, now=False)
+
+    async def parse_item(self, kind: Kind, response) -> tuple[dict, Optional[str]]:
+        if self.parse_pool is None:
+            return self.parse_page(kind, response)
+        loop = asyncio.get_running_loop()
+        item, thumb_url = await loop.run_in_executor(
+            self.parse_pool,
+            parse_page,
+            kind,
+            response.url,
+            response.body,
+            response.encoding,
+        )
+        # interned strings are copies after unpickling, intern them again
+        for idol_group in item.get("_groups", []):
+            idol_group["url"] = sys.intern(idol_group["url"])
+            if idol_group["roles"]:
+                idol_group["roles"] = sys.intern(idol_group["roles"])
+        if "agency_name" in item:
+            item["agency_name"] = sys.intern(item["agency_name"])
+        return item, thumb_url
+
+    def follow(self, response: Response, url: str, callback):
+        """Follow URL only once per crawl, without building duplicate requests."""
+        url = response.urljoin(url)
+        if not self.frontier.add(url):
+            self.crawler.stats.inc_value("kastden/frontier/avoided")
+            return None
+        self.crawler.stats.set_value("kastden/frontier/size", len(self.frontier))
+        return response.follow(url, callback=callback)
+
+    def resume_page(self, kind: Kind, url: str) -> Optional[dict]:
+        """Take page finished by interrupted crawl, if any."""
+        record = self.resumed.pages[kind].pop(url, None)
+        if record is None:
+            return None
+        self.frontier.add(url)
+        self.state.add_record(kind, url, record)
+        self.crawler.stats.inc_value(f"kastden/resumed/{kind}")
+        return record.item
+
+    def follow_groups(self, response: Response, idol: dict):
+        for idol_group in idol["_groups"]:
+            url = response.urljoin(idol_group["url"])
+            if self.resume_page("groups", url) is not None:
+                continue
+            request = self.follow(response, url, self.parse_group)
+            if request:
+                yield request
+
+    def save_checkpoint(self):
+        """Save finished pages, i.e. parsed and with thumbnail downloaded."""
+        # pages waiting for thumbnail are added to the state only after it
+        checkpoint = CrawlState()
+        checkpoint.merge(self.state)
+        # not reached again yet, but still finished
+        checkpoint.merge(self.resumed)
+        checkpoint.save(self.checkpoint_fpath)
+        self.crawler.stats.set_value("kastden/checkpoint/pages", len(checkpoint))
+
+    def in_shard(self, url: str) -> bool:
+        if not self.shard:
+            return True
+        index, count = self.shard
+        # stable across processes, unlike hash()
+        return FingerprintSet.fingerprint(url) % count == index
+
+    def parse(self, response):
+        for href in response.css(".cell_line a::attr(href)").getall():
+            if href.startswith("/noona/idol/"):
+                url = response.urljoin(href)
+                if not self.in_shard(url):
+                    self.crawler.stats.inc_value("kastden/shard/skipped")
+                    continue
+                idol = self.resume_page("idols", url)
+                if idol is not None:
+                    yield from self.follow_groups(response, idol)
+                    continue
+                request = self.follow(response, href, self.parse_idol)
+                if request:
+                    yield request
+
+    def download_thumb(
+        self,
+        response: Response,
+        kind: Kind,
+        fingerprint: str,
+        item: dict,
+        thumb_url: str,
+    ):
+        # Callbacks are better than await here because we can download
+        # everything asynchonously. State keeps items encoded, so page is
+        # added to it only once thumb_url is known.
+        return response.follow(
+            thumb_url,
+            callback=self.write_thumb,
+            errback=self.thumb_failed,
+            cb_kwargs=dict(
+                kind=kind, page_url=response.url, fingerprint=fingerprint, item=item
+            ),
+            meta={"download_slot": self.THUMB_SLOT},
+            priority=self.THUMB_PRIORITY,
+        )
+
+    async def write_thumb(
+        self,
+        response: Response,
+        kind: Kind,
+        page_url: str,
+        fingerprint: str,
+        item: dict,
+    ):
+        fname = await self.thumbs.process(response.body)
+        item["thumb_url"] = self.THUMB_BASE_URL + "/" + fname
+        self.state.add(kind, page_url, fingerprint, item)
+
+    def thumb_failed(self, failure):
+        # thumbnail is optional, keep the item without it
+        kwargs = failure.request.cb_kwargs
+        if failure.check(HttpError):
+            self.logger.warning(f"Thumbnail not downloaded: {failure.request.url}")
+        else:
+            self.logger.error(f"Thumbnail not downloaded: {failure!r}")
+        self.state.add(
+            kwargs["kind"], kwargs["page_url"], kwargs["fingerprint"], kwargs["item"]
+        )
+
+    def build_thumb_variants(self, profiles: Profiles) -> ThumbVariants:
+        sizes = [int(size) for size in self.settings.getlist("THUMB_SIZES")]
+        formats = self.settings.getlist("THUMB_FORMATS")
+        fpaths = set()
+        prefix = self.THUMB_BASE_URL + "/"
+        for item in profiles["idols"] + profiles["groups"]:
+            if item["thumb_url"]:
+                fpath = self.out_thumb_dpath / item["thumb_url"].removeprefix(prefix)
+                if fpath.exists():
+                    fpaths.add(fpath)
+                else:
+                    # Published data doesn't depend on local thumb/, only
+                    # variants of this file aren't built
+                    self.logger.warning(f"Missing thumbnail: {fpath}")
+                    self.crawler.stats.inc_value("thumbs/missing")
+        workers = self.settings.getint("THUMB_BUILD_WORKERS") or None
+        built = build_all_variants(sorted(fpaths), sizes, formats, workers)
+        self.crawler.stats.set_value("thumbs/variants_built", built)
+        return {"sizes": sizes, "formats": formats}
+
+    async def parse_idol(self, response):
+        fingerprint = page_fingerprint(response.text)
+        idol = self.prev_state.find("idols", response.url, fingerprint)
+        if idol is None:
+            idol, thumb_url = await self.parse_item("idols", response)
+        else:
+            thumb_url = None
+            self.crawler.stats.inc_value("kastden/reused/idols")
+        for request in self.follow_groups(response, idol):
+            yield request
+        if thumb_url:  # optional
+            yield self.download_thumb(
+                response, "idols", fingerprint, cast(dict, idol), thumb_url
+            )
+        else:
+            self.state.add("idols", response.url, fingerprint, cast(dict, idol))
+
+    async def parse_group(self, response):
+        fingerprint = page_fingerprint(response.text)
+        group = self.prev_state.find("groups", response.url, fingerprint)
+        if group is None:
+            group, thumb_url = await self.parse_item("groups", response)
+        else:
+            thumb_url = None
+            self.crawler.stats.inc_value("kastden/reused/groups")
+        if thumb_url:  # optional
+            yield self.download_thumb(
+                response, "groups", fingerprint, cast(dict, group), thumb_url
+            )
+        else:
+            self.state.add("groups", response.url, fingerprint, cast(dict, group))
 
     def closed(self, reason):
+        self.thumbs.close()
+        if self.parse_pool:
+            self.parse_pool.shutdown()
+        if self.checkpoint_task and self.checkpoint_task.running:
+            self.checkpoint_task.stop()
+        self.timer.stop("crawl")
+        try:
+            with self.timer("closed"):
+                self.finalize(reason)
+        finally:
+            for stage, (wall, cpu) in self.timer.stages.items():
+                self.crawler.stats.set_value(f"time/{stage}/wall", wall)
+                self.crawler.stats.set_value(f"time/{stage}/cpu", cpu)
+
+    def shard_state_fpaths(self) -> list[Path]:
+        return [
+            self.data_dpath / self.SHARD_STATE_FNAME.format(index, self.merge)
+            for index in range(self.merge)
+        ]
+
+    def load_shards(self) -> CrawlState:
+        """Merge states of all shards, groups may be present in several."""
+        state = CrawlState()
+        for fpath in self.shard_state_fpaths():
+            state.merge(CrawlState.load(fpath))
+        return state
+
+    def finalize(self, reason):
         if reason != "finished":
+            if self.crawling:
+                self.save_checkpoint()
+                self.log(f"Checkpoint saved to {self.checkpoint_fpath}, use --resume")
             self.log("Exited with error, no dump")
             return
+        if self.offline:
+            missing = self.crawler.stats.get_value("httpcache/ignore", 0)
+            if missing:
+                self.logger.error(f"{missing} requests missing from cache, no dump")
+                return
+        self.prune_cache = self.full_crawl
+
+        if self.merge:
+            self.log("Merging shards")
+            with self.timer("merge"):
+                self.state = self.load_shards()
+
+        if self.rebuild:
+            # Raw records are as parsed, overrides and ids are applied below
+            self.log(f"Rebuilding from {self.state_fpath}")
+            with self.timer("load_state"):
+                self.state = CrawlState.load(self.state_fpath)
+        else:
+            # Save raw records before they're modified
+            self.log("Saving crawl state")
+            with self.timer("save_state"):
+                self.state.save(self.state_fpath)
+            self.checkpoint_fpath.unlink(missing_ok=True)
+        if self.merge:
+            # merged into the saved state, stale ones would be merged again
+            for fpath in self.shard_state_fpaths():
+                fpath.unlink()
+        if self.shard:
+            self.log(f"Shard saved to {self.state_fpath}, merge to build output")
+            return
+
+        # Items are kept only in the state, take them out and free everything
+        # else before building the output
+        idols = cast(list[Idol], list(self.state.take_items("idols")))
+        groups = cast(list[Group], list(self.state.take_items("groups")))
+        self.state = self.prev_state = CrawlState()
 
         self.log("Processing data")
-        idol_key = lambda i: (i["birth_date"], i["real_name"])
-        group_key = lambda g: (g["debut_date"] or "0", g["name"])
-        idols = sorted(self.all_idols, key=idol_key, reverse=True)
-        groups = sorted(self.all_groups, key=group_key, reverse=True)
-
-        # Modify idol/group data *in place*
-        group_by_id = dict((g["id"], g) for g in groups)
-        # XXX: second url is kastden
-        group_by_url = dict((g["urls"][1], g) for g in groups)
-        idol_groups_key = lambda gid: group_key(group_by_id[gid])
-
-        for group in groups:
-            group["members"] = []
-        for idol in idols:
-            idol["groups"] = []
-            for idol_group in idol.pop("_groups"):
-                group = group_by_url[idol_group["url"]]
-                idol["groups"].append(group["id"])
-                group["members"].append(
-                    {
-                        "idol_id": idol["id"],
-                        "current": idol_group["current"],
-                        "roles": idol_group["roles"],
-                    }
-                )
-            idol["groups"].sort(key=idol_groups_key, reverse=True)
-        # fix subunits
-        for group in groups:
-            if group["parent_id"]:
-                parent_group = group_by_url[group["parent_id"]]
-                group["parent_id"] = parent_group["id"]
-                for member in group["members"]:
-                    # O(n^2) but should be fine
-                    parent_member = find_by_field(
-                        parent_group["members"], "idol_id", member["idol_id"]
-                    )
-                    assert parent_member, (group, member)
-                    member["current"] = parent_member["current"]
+        with self.timer("normalize"):
+            for idol in idols:
+                IdolValidator.normalize(cast(dict, idol), self.idol_overrides)
+            for group in groups:
+                GroupValidator.normalize(cast(dict, group), self.group_overrides)
+            for kind, overrides in [
+                ("idol", self.idol_overrides),
+                ("group", self.group_overrides),
+            ]:
+                for override in overrides.unmatched():
+                    match = override["match"]
+                    self.logger.warning(f"Unused {kind} override: {match}")
+
+        with self.timer("link"):
+            profiles = link_profiles(idols, groups)
 
         # Validate after modifications
-        IdolValidator.validate_all(self.all_idols)
-        GroupValidator.validate_all(self.all_groups)
+        with self.timer("validate"):
+            report = validate_profiles(profiles)
+        with atomic_open(self.data_dpath / self.REPORT_FNAME) as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+        if not report.ok:
+            for violation in report.violations:
+                self.logger.error(f"Invalid profile: {violation}")
+            self.logger.error(f"{len(report.violations)} violations, no dump")
+            return
+
+        self.log("Building thumbnail variants")
+        with self.timer("thumb_variants"):
+            profiles["thumb_variants"] = self.build_thumb_variants(profiles)
+
+        # Previous release is the committed file, not whatever earlier dump
+        # left in the tree
+        prev_profiles = load_release(self.out_json_fpath)
+        if prev_profiles is None:
+            self.logger.warning("No released kpopnet.json, skipping delta")
 
-        profiles: Profiles = {"idols": idols, "groups": groups}
         self.log("Dumping data")
-        with open(self.out_json_fpath, "w") as f:
-            json.dump(profiles, f, ensure_ascii=False, sort_keys=True, indent=2)
-        with open(self.out_minjson_fpath, "w") as f:
-            json.dump(
-                profiles, f, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        with self.timer("dump"):
+            dump_json(profiles, self.out_json_fpath, self.out_minjson_fpath)
+            dump_binary(profiles, self.out_bin_fpath)
+            dump_ndjson(profiles["idols"], self.out_idols_ndjson_fpath)
+            dump_ndjson(profiles["groups"], self.out_groups_ndjson_fpath)
+
+        self.log("Dumping search index")
+        with self.timer("search"):
+            dump_search(profiles, self.out_search_fpath)
+
+        self.log("Dumping per-entity files")
+        with self.timer("entities"):
+            written = dump_entities(profiles, self.out_entities_dpath)
+            self.crawler.stats.set_value("entities/written", written)
+
+        self.log("Dumping delta from previous release")
+        with self.timer("delta"):
+            dump_delta(
+                prev_profiles,
+                profiles,
+                [
+                    self.out_json_fpath,
+                    self.out_minjson_fpath,
+                    self.out_bin_fpath,
+                    self.out_search_fpath,
+                    self.out_idols_ndjson_fpath,
+                    self.out_groups_ndjson_fpath,
+                ],
+                self.out_delta_fpath,
+                self.out_manifest_fpath,
             )
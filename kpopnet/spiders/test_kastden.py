@@ -1,6 +1,14 @@
+from pathlib import Path
+
 import pytest
 
-pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+FIXTURES_DPATH = Path(__file__).parent / "fixtures"
+KASTDEN_URL = "https://selca.kastden.org/noona/"
+
+pytestmark = [
+    pytest.mark.filterwarnings("ignore::DeprecationWarning"),
+    pytest.mark.filterwarnings("ignore::scrapy.exceptions.ScrapyDeprecationWarning"),
+]
 
 
 @pytest.fixture()
@@ -10,6 +18,14 @@ def spider():
     return KastdenSpider()
 
 
+def load_fixture(name: str, path: str):
+    from scrapy.http import HtmlResponse, Request
+
+    url = KASTDEN_URL + path
+    body = (FIXTURES_DPATH / name).read_bytes()
+    return HtmlResponse(url, body=body, encoding="utf-8", request=Request(url))
+
+
 def test_parse_date(spider):
     s = spider
     assert s.parse_date("date", "2003-01-09") == "2003-01-09"
@@ -38,3 +54,321 @@ def test_parse_name_alias(spider):
     assert (
         s.parse_name_alias("Tae E ( 태이  )  ,  Jian  ( 지안 ) ") == "Tae E, 태이, Jian, 지안"
     )
+
+
+def test_parse_idol_page(spider):
+    s = spider
+    idol = s.parse_idol_page(load_fixture("idol_boram.html", "idol/boram/"))
+    assert idol == {
+        "name": "Boram",
+        "name_original": "보람",
+        "real_name": "Jeon Boram",
+        "real_name_original": "전보람",
+        "birth_date": "1986-03-22",
+        "debut_date": "2008-04-15",
+        "height": 152.8,
+        "weight": 40.0,
+        "urls": [
+            "https://selca.kastden.org/noona/idol/boram/",
+            "https://namu.wiki/w/보람(T-ARA)",
+        ],
+        "_groups": [
+            {
+                "url": "https://selca.kastden.org/noona/group/tara/",
+                "current": True,
+                "roles": "vocal, main dancer",
+            },
+            {
+                "url": "https://selca.kastden.org/noona/group/qbs/",
+                "current": True,
+                "roles": None,
+            },
+        ],
+    }
+
+    idol = s.parse_idol_page(load_fixture("idol_eunjung.html", "idol/eunjung/"))
+    assert idol["name_alias"] == "Elsie, 엘시, Ham Eunjung, 함은정, 咸恩靜"
+    assert idol["debut_date"] == "2009-01-01"
+    assert idol["height"] == 164.0
+    assert "weight" not in idol
+    assert idol["_groups"][0]["current"] is False
+
+
+def test_parse_group_page(spider):
+    s = spider
+    group = s.parse_group_page(load_fixture("group_tara.html", "group/tara/"))
+    assert group == {
+        "name": "T-ara",
+        "name_original": "티아라",
+        "agency_name": "MBK Entertainment",
+        "debut_date": "2009-07-29",
+        "urls": [
+            "https://selca.kastden.org/noona/group/tara/",
+            "https://namu.wiki/w/T-ARA",
+        ],
+    }
+
+    group = s.parse_group_page(load_fixture("group_qbs.html", "group/qbs/"))
+    assert group["parent_id"] == "https://selca.kastden.org/noona/group/tara/"
+    assert group["agency_name"] == "MBK Entertainment"
+    assert group["debut_date"] == "2013-06-01"
+    assert group["disband_date"] == "2014-01-01"
+
+
+def test_parse_page(spider):
+    from .kastden import parse_page
+
+    # worker entry point gets plain arguments, result must match spider's
+    response = load_fixture("idol_boram.html", "idol/boram/")
+    item, thumb_url = parse_page("idols", response.url, response.body, "utf-8")
+    assert item == spider.parse_idol_page(response)
+    assert thumb_url == "/static/media/idols/tara_boram.jpg"
+
+
+def test_checkpoint(tmp_path):
+    from scrapy.utils.test import get_crawler
+
+    from .kastden import KastdenSpider
+    from ..state import CrawlState
+
+    crawler = get_crawler(KastdenSpider)
+    spider = KastdenSpider.from_crawler(crawler)
+    spider.checkpoint_fpath = tmp_path / "checkpoint.json"
+    response = load_fixture("idol_boram.html", "idol/boram/")
+    idol = spider.parse_idol_page(response)
+    spider.state.add("idols", response.url, "01", idol)
+    # thumbnail not downloaded yet, page must be crawled again
+    jiyeon = load_fixture("idol_boram.html", "idol/jiyeon/")
+    request = spider.download_thumb(jiyeon, "idols", "02", {}, "/jiyeon.jpg")
+    assert request.errback == spider.thumb_failed
+    spider.save_checkpoint()
+
+    spider = KastdenSpider.from_crawler(crawler)
+    spider.resumed = CrawlState.load(tmp_path / "checkpoint.json")
+    assert spider.resume_page("idols", KASTDEN_URL + "idol/jiyeon/") is None
+    assert spider.resume_page("idols", response.url) == idol
+    assert spider.state.find("idols", response.url, "01") == idol
+    requests = list(spider.follow_groups(response, idol))
+    assert [r.url for r in requests] == [g["url"] for g in idol["_groups"]]
+
+
+def test_missing_thumb(tmp_path):
+    from scrapy.utils.test import get_crawler
+
+    from .kastden import KastdenSpider
+
+    spider = KastdenSpider.from_crawler(get_crawler(KastdenSpider))
+    spider.out_thumb_dpath = tmp_path
+    idol = {"thumb_url": KastdenSpider.THUMB_BASE_URL + "/ab/cdef.jpg"}
+    group = {"thumb_url": None}
+    thumb_url = idol["thumb_url"]
+    spider.build_thumb_variants({"idols": [idol], "groups": [group]})
+    assert idol["thumb_url"] == thumb_url
+    assert spider.crawler.stats.get_value("thumbs/missing") == 1
+
+
+def output_spider(tmp_path, settings=None, **kwargs):
+    """Spider writing everything to tmp_path, with no overrides."""
+    from scrapy.utils.test import get_crawler
+
+    from .kastden import KastdenSpider
+    from ..overrides import OverrideIndex
+
+    settings_dict = {"THUMB_WORKERS": 1, **(settings or {})}
+    crawler = get_crawler(KastdenSpider, settings_dict=settings_dict)
+    spider = KastdenSpider.from_crawler(crawler, **kwargs)
+    for attr, value in list(vars(spider).items()):
+        if attr.startswith("out_"):
+            setattr(spider, attr, tmp_path / value.name)
+    spider.data_dpath = tmp_path
+    spider.state_fpath = tmp_path / spider.STATE_FNAME
+    spider.checkpoint_fpath = tmp_path / spider.CHECKPOINT_FNAME
+    spider.idol_overrides = OverrideIndex([])
+    spider.group_overrides = OverrideIndex([])
+    return spider
+
+
+def save_fixture_state(spider):
+    from ..state import CrawlState
+
+    state = CrawlState()
+    for n, (name, path) in enumerate(
+        [("idol_boram.html", "idol/boram/"), ("idol_eunjung.html", "idol/eunjung/")]
+    ):
+        idol = spider.parse_idol_page(load_fixture(name, path))
+        state.add("idols", KASTDEN_URL + path, f"{n:02}", idol)
+    for n, (name, path) in enumerate(
+        [("group_tara.html", "group/tara/"), ("group_qbs.html", "group/qbs/")]
+    ):
+        group = spider.parse_group_page(load_fixture(name, path))
+        state.add("groups", KASTDEN_URL + path, f"{n:02}", group)
+    state.save(spider.state_fpath)
+
+
+def test_rebuild(tmp_path):
+    import json
+
+    from ..overrides import OverrideIndex
+
+    spider = output_spider(tmp_path, rebuild=True)
+    save_fixture_state(spider)
+    state_data = spider.state_fpath.read_bytes()
+    spider.finalize("finished")
+    profiles = json.loads(spider.out_json_fpath.read_text())
+    boram = next(i for i in profiles["idols"] if i["name"] == "Boram")
+    assert boram["real_name_original"] == "전보람"
+
+    # changed override of ID field
+    spider = output_spider(tmp_path, rebuild=True)
+    spider.idol_overrides = OverrideIndex(
+        [
+            {
+                "match": {"name_original": "보람", "birth_date": "1986-03-22"},
+                "update": {"real_name_original": "전보람2"},
+            }
+        ]
+    )
+    spider.finalize("finished")
+    rebuilt = json.loads(spider.out_json_fpath.read_text())
+    new_boram = next(i for i in rebuilt["idols"] if i["name"] == "Boram")
+    assert new_boram["real_name_original"] == "전보람2"
+    assert new_boram["id"] != boram["id"]
+    assert new_boram["urls"][0] == f"https://net.kpop.re/?id={new_boram['id']}"
+    assert new_boram["urls"][1:] == boram["urls"][1:]
+    members = [m["idol_id"] for g in rebuilt["groups"] for m in g["members"]]
+    assert new_boram["id"] in members and boram["id"] not in members
+    assert len(rebuilt["idols"]) == 2 and len(rebuilt["groups"]) == 2
+    # raw records are kept as crawled
+    assert spider.state_fpath.read_bytes() == state_data
+
+
+def test_offline_cache_miss(tmp_path, caplog):
+    spider = output_spider(tmp_path, offline=True)
+    spider.opened()
+    idol = spider.parse_idol_page(load_fixture("idol_boram.html", "idol/boram/"))
+    spider.state.add("idols", KASTDEN_URL + "idol/boram/", "01", idol)
+    spider.crawler.stats.set_value("httpcache/ignore", 1)
+    spider.closed("finished")
+    assert "1 requests missing from cache, no dump" in caplog.text
+    assert not spider.state_fpath.exists()
+    assert not spider.out_json_fpath.exists()
+    assert not spider.prune_cache
+    stats = spider.crawler.stats
+    for stage in ["crawl", "closed"]:
+        assert stats.get_value(f"time/{stage}/wall") >= 0
+        assert stats.get_value(f"time/{stage}/cpu") >= 0
+
+
+def test_offline_keeps_cache(tmp_path):
+    from scrapy.http import Request, Response
+
+    from ..httpcache import SqliteCacheStorage
+    from ..state import CrawlState
+
+    settings = {"HTTPCACHE_DIR": str(tmp_path / "cache"), "HTTPCACHE_PRUNE": True}
+    spider = output_spider(tmp_path, settings, offline=True)
+    storage = SqliteCacheStorage(spider.crawler.settings)
+    storage.open_spider(spider)
+    for url in [KASTDEN_URL + "idol/boram/", KASTDEN_URL + "idol/unused/"]:
+        storage.store_response(spider, Request(url), Response(url, body=b"."))
+    storage.close_spider(spider)
+    rows = "SELECT * FROM responses ORDER BY fingerprint"
+
+    # replay reaches only one of the pages
+    storage = SqliteCacheStorage(spider.crawler.settings)
+    storage.open_spider(spider)
+    assert storage.retrieve_response(spider, Request(KASTDEN_URL + "idol/boram/"))
+    expected = storage.db.execute(rows).fetchall()
+    save_fixture_state(spider)
+    spider.state = CrawlState.load(spider.state_fpath)
+    spider.finalize("finished")
+    assert spider.out_json_fpath.exists()
+    storage.close_spider(spider)
+    assert spider.crawler.stats.get_value("httpcache/pruned") is None
+
+    storage = SqliteCacheStorage(spider.crawler.settings)
+    storage.open_spider(spider)
+    assert storage.db.execute(rows).fetchall() == expected
+    assert len(expected) == 2
+
+
+def crawl_fixtures(spider, pages: dict[str, bytes]) -> list[str]:
+    """Run callbacks like the engine would, return requested thumbnails."""
+    import io
+    import asyncio
+
+    from PIL import Image
+    from scrapy.http import HtmlResponse, Request, Response
+
+    image = io.BytesIO()
+    Image.new("RGB", (300, 400), "red").save(image, "JPEG")
+    thumbs = []
+
+    def respond(request):
+        body = pages[request.url]
+        return HtmlResponse(request.url, body=body, encoding="utf-8", request=request)
+
+    async def run():
+        origin = "https://selca.kastden.org"
+        links = "".join(
+            f'<div class="cell_line"><a href="{url.removeprefix(origin)}">x</a></div>'
+            for url in pages
+            if "/idol/" in url
+        )
+        listing = HtmlResponse(
+            spider.start_urls[0], body=links.encode(), encoding="utf-8"
+        )
+        queue = list(spider.parse(listing))
+        while queue:
+            request = queue.pop(0)
+            if request.callback == spider.write_thumb:
+                thumbs.append(request.url)
+                response = Response(request.url, body=image.getvalue())
+                await spider.write_thumb(response, **request.cb_kwargs)
+                continue
+            async for output in request.callback(respond(request)):
+                if isinstance(output, Request):
+                    queue.append(output)
+
+    spider.opened()
+    asyncio.run(run())
+    spider.closed("finished")
+    return thumbs
+
+
+def test_incremental(tmp_path, monkeypatch):
+    import json
+
+    from . import kastden
+
+    # previous state is looked up in the data dir
+    monkeypatch.setattr(kastden, "data_path", lambda *args, **kwargs: tmp_path)
+    pages = {}
+    for name in ["idol_boram", "idol_eunjung", "group_tara", "group_qbs"]:
+        kind, slug = name.split("_")
+        url = f"{KASTDEN_URL}{kind}/{slug}/"
+        pages[url] = (FIXTURES_DPATH / f"{name}.html").read_bytes()
+
+    spider = output_spider(tmp_path)
+    thumbs = crawl_fixtures(spider, pages)
+    assert len(thumbs) == 2  # Boram and T-ara
+    profiles = json.loads(spider.out_json_fpath.read_text())
+
+    eunjung_url = KASTDEN_URL + "idol/eunjung/"
+    pages[eunjung_url] = pages[eunjung_url].replace(b"Eunjung", b"Eunjeong")
+    spider = output_spider(tmp_path, incremental=True)
+    assert len(spider.prev_state) == 4
+    assert crawl_fixtures(spider, pages) == []
+    stats = spider.crawler.stats
+    assert stats.get_value("kastden/reused/idols") == 1
+    assert stats.get_value("kastden/reused/groups") == 2
+    assert stats.get_value("thumbs/count") is None
+
+    rebuilt = json.loads(spider.out_json_fpath.read_text())
+    names = sorted(idol["name"] for idol in rebuilt["idols"])
+    assert names == ["Boram", "Eunjeong"]
+    # reused pages keep thumbnails downloaded by the first crawl
+    assert rebuilt["groups"] == profiles["groups"]
+    boram = [i for i in profiles["idols"] if i["name"] == "Boram"]
+    assert [i for i in rebuilt["idols"] if i["name"] == "Boram"] == boram
+    assert boram[0]["thumb_url"]
@@ -0,0 +1,113 @@
+import sys
+import json
+from pathlib import Path
+from typing import Iterator, Literal, Optional
+
+from .dump import atomic_open
+
+Kind = Literal["idols", "groups"]
+KINDS: tuple[Kind, Kind] = ("idols", "groups")
+
+
+# same few group URLs, roles and agencies are repeated in many items
+INTERNED_FIELDS = {"url", "roles", "agency_name"}
+
+
+def encode_item(item: dict) -> bytes:
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def intern_pairs(pairs: list) -> dict:
+    # separately decoded items would have own copies of every key
+    return dict(
+        (
+            sys.intern(k),
+            sys.intern(v) if k in INTERNED_FIELDS and type(v) is str else v,
+        )
+        for k, v in pairs
+    )
+
+
+def decode_item(data: bytes) -> dict:
+    return json.loads(data, object_pairs_hook=intern_pairs)
+
+
+class PageRecord:
+    """Finished page: fingerprint and raw parsed item as minified JSON.
+
+    Item is kept encoded, several times smaller than the dict, and decoded
+    only when needed. Raw item is before overrides/ID generation.
+    """
+
+    __slots__ = ("fingerprint", "data")
+
+    def __init__(self, fingerprint: bytes, data: bytes):
+        self.fingerprint = fingerprint
+        self.data = data
+
+    @property
+    def item(self) -> dict:
+        return decode_item(self.data)
+
+
+# Raw crawl results persisted between runs, keyed by kastden page URL.
+# Used to skip re-parsing of unchanged pages in incremental mode and as the
+# only in-crawl store of parsed items.
+class CrawlState:
+    def __init__(self):
+        self.pages: dict[Kind, dict[str, PageRecord]] = {"idols": {}, "groups": {}}
+
+    @classmethod
+    def load(cls, fpath: Path) -> "CrawlState":
+        state = cls()
+        with open(fpath, encoding="utf-8") as f:
+            pages = json.load(f)
+        for kind in KINDS:
+            for url, record in pages[kind].items():
+                state.add(kind, url, record["fingerprint"], record["item"])
+        return state
+
+    def save(self, fpath: Path):
+        # records are already encoded, write them as is
+        with atomic_open(fpath) as f:
+            for n, kind in enumerate(KINDS):
+                f.write(("{" if n == 0 else ",") + json.dumps(kind) + ":{")
+                for m, (url, record) in enumerate(self.pages[kind].items()):
+                    f.write(("" if m == 0 else ",") + json.dumps(url) + ":")
+                    f.write(f'{{"fingerprint":"{record.fingerprint.hex()}","item":')
+                    f.write(record.data.decode())
+                    f.write("}")
+                f.write("}")
+            f.write("}")
+
+    def merge(self, other: "CrawlState"):
+        """Add pages of other state, pages already present are kept."""
+        for kind, pages in other.pages.items():
+            for url, record in pages.items():
+                self.pages[kind].setdefault(url, record)
+
+    def find(self, kind: Kind, url: str, fingerprint: str) -> Optional[dict]:
+        record = self.pages[kind].get(url)
+        if record and record.fingerprint == bytes.fromhex(fingerprint):
+            return record.item
+        return None
+
+    def add(self, kind: Kind, url: str, fingerprint: str, item: dict):
+        record = PageRecord(bytes.fromhex(fingerprint), encode_item(item))
+        self.pages[kind][url] = record
+
+    def add_record(self, kind: Kind, url: str, record: PageRecord):
+        self.pages[kind][url] = record
+
+    def take_items(self, kind: Kind) -> Iterator[dict]:
+        """Decode items one by one, removing them from the state."""
+        pages = self.pages[kind]
+        while pages:
+            _, record = pages.popitem()
+            yield record.item
+
+    def items(self, kind: Kind) -> list[dict]:
+        return [record.item for record in self.pages[kind].values()]
+
+    def __len__(self) -> int:
+        return len(self.pages["idols"]) + len(self.pages["groups"])
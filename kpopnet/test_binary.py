@@ -0,0 +1,30 @@
+import json
+
+from .binary import dump_binary, load_binary
+from .db import DEFAULT_FPATH
+
+
+def test_binary_roundtrip(tmp_path):
+    profiles = json.load(open(DEFAULT_FPATH))
+    profiles["thumb_variants"] = {"sizes": [64, 128], "formats": ["jpg", "webp"]}
+    fpath = tmp_path / "kpopnet.bin"
+    dump_binary(profiles, fpath)
+    assert fpath.stat().st_size < DEFAULT_FPATH.stat().st_size / 2
+
+    with load_binary(fpath) as bp:
+        assert bp.to_profiles() == profiles
+        dumped = json.dumps(bp.to_profiles(), ensure_ascii=False, sort_keys=True)
+        assert dumped == json.dumps(profiles, ensure_ascii=False, sort_keys=True)
+
+        group = profiles["groups"][-1]
+        assert bp.get_group(group["id"]) == group
+        idol = profiles["idols"][10]
+        assert bp.get_idol(idol["id"]) == idol
+        assert bp.get_idol("missing") is None
+
+
+def test_binary_empty(tmp_path):
+    fpath = tmp_path / "kpopnet.bin"
+    dump_binary({"idols": [], "groups": []}, fpath)
+    with load_binary(fpath) as bp:
+        assert bp.to_profiles() == {"idols": [], "groups": []}
@@ -0,0 +1,38 @@
+import json
+
+from .binary import dump_binary
+from .db import load, DEFAULT_FPATH
+
+
+def check_db(db, profiles):
+    idols = list(db.idols())
+    groups = list(db.groups())
+    assert idols == profiles["idols"]
+    assert groups == profiles["groups"]
+
+    group = groups[0]
+    assert db.get_group(group["id"]) == group
+    assert db.get_idol("missing") is None
+    assert db.find_groups(group["name"].upper()) == [group]
+    assert group in db.find(group["name_original"])
+
+    members = db.current_members(group["id"])
+    current_ids = [m["idol_id"] for m in group["members"] if m["current"]]
+    assert [i["id"] for i in members] == current_ids
+    for idol in members:
+        assert group in db.idol_groups(idol["id"])
+
+
+def test_db(tmp_path):
+    profiles = json.load(open(DEFAULT_FPATH))
+    profiles["thumb_variants"] = {"sizes": [64], "formats": ["jpg"]}
+    fpath = tmp_path / "kpopnet.json"
+    fpath.write_text(json.dumps(profiles, ensure_ascii=False, indent=2))
+    # no binary, converted in memory
+    with load(fpath) as db:
+        check_db(db, profiles)
+
+    dump_binary(profiles, tmp_path / "kpopnet.bin")
+    with load(fpath) as db:
+        assert db.profiles.mm is not None
+        check_db(db, profiles)
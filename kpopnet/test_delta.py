@@ -0,0 +1,59 @@
+import copy
+import json
+import subprocess
+
+from .delta import apply_delta, content_hash, load_release, make_delta
+
+
+def make_profiles() -> dict:
+    idols = [
+        {"id": "a", "real_name": "A", "birth_date": "1991-01-01", "groups": ["g"]},
+        {"id": "b", "real_name": "B", "birth_date": "1990-01-01", "groups": ["g"]},
+    ]
+    members = [
+        {"idol_id": "a", "current": True, "roles": None},
+        {"idol_id": "b", "current": True, "roles": "leader"},
+    ]
+    groups = [{"id": "g", "name": "G", "debut_date": "2010-01-01", "members": members}]
+    return {"idols": idols, "groups": groups}
+
+
+def test_delta_roundtrip():
+    old = make_profiles()
+    new = copy.deepcopy(old)
+    new["idols"][1]["real_name"] = "Bee"
+    new["idols"].insert(
+        0, {"id": "c", "real_name": "C", "birth_date": "1995-01-01", "groups": ["g"]}
+    )
+    members = new["groups"][0]["members"]
+    members[1]["current"] = False
+    members.insert(0, {"idol_id": "c", "current": True, "roles": None})
+    new["groups"].append({"id": "h", "name": "H", "debut_date": None, "members": []})
+    new["thumb_variants"] = {"sizes": [64], "formats": ["jpg"]}
+
+    delta = make_delta(old, new)
+    assert delta["idols"]["changed"] == {"b": {"real_name": "Bee"}}
+    assert delta["members"]["g"]["changed"] == {"b": {"current": False}}
+    assert apply_delta(copy.deepcopy(old), delta) == new
+    assert content_hash(new) == delta["to"]
+
+    delta = make_delta(new, old)
+    assert delta["idols"]["removed"] == ["c"]
+    assert apply_delta(new, delta) == old
+
+
+def test_load_release(tmp_path):
+    fpath = tmp_path / "kpopnet.json"
+    fpath.write_text(json.dumps(make_profiles()))
+    assert load_release(fpath) is None  # not a repo
+
+    def git(*args):
+        subprocess.run(["git", *args], cwd=tmp_path, check=True, capture_output=True)
+
+    git("init")
+    git("add", "kpopnet.json")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-m", "release")
+    # unreleased dump
+    fpath.write_text(json.dumps({"idols": [], "groups": []}))
+    assert load_release(fpath) == make_profiles()
+    assert load_release(tmp_path / "other.json") is None
@@ -0,0 +1,50 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from .dump import atomic_open, dump_json
+
+DATA_FPATH = Path(__file__).parent / ".." / "kpopnet.json"
+
+
+def test_dump_json_same_as_json_dump(tmp_path):
+    profiles = json.load(open(DATA_FPATH))
+    profiles["idols"][0]["weight"] = 40.5
+    profiles["idols"][0]["groups"] = []
+    profiles["idols"][0]["extra"] = {"z": 1, "a": [True, False, None, {}]}
+    json_fpath = tmp_path / "kpopnet.json"
+    minjson_fpath = tmp_path / "kpopnet.min.json"
+    dump_json(profiles, json_fpath, minjson_fpath)
+
+    pretty = json.dumps(profiles, ensure_ascii=False, sort_keys=True, indent=2)
+    minified = json.dumps(
+        profiles, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    )
+    assert json_fpath.read_text() == pretty
+    assert minjson_fpath.read_text() == minified
+
+
+def test_dump_json_keeps_previous_on_error(tmp_path):
+    json_fpath = tmp_path / "kpopnet.json"
+    minjson_fpath = tmp_path / "kpopnet.min.json"
+    dump_json({"idols": [], "groups": []}, json_fpath, minjson_fpath)
+
+    with pytest.raises(TypeError):
+        dump_json({"idols": [object()], "groups": []}, json_fpath, minjson_fpath)
+    assert json.loads(json_fpath.read_text()) == {"idols": [], "groups": []}
+    assert json.loads(minjson_fpath.read_text()) == {"idols": [], "groups": []}
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "kpopnet.json",
+        "kpopnet.min.json",
+    ]
+
+
+def test_atomic_open_concurrent_writers(tmp_path):
+    fpath = tmp_path / "metrics.json"
+    with atomic_open(fpath) as first, atomic_open(fpath) as second:
+        first.write("1")
+        second.write("2")
+    assert fpath.read_text() == "1"
+    assert fpath.stat().st_mode & 0o777 == 0o644
+    assert [p.name for p in tmp_path.iterdir()] == ["metrics.json"]
@@ -0,0 +1,25 @@
+import gzip
+import json
+
+from .entities import dump_entities
+
+
+def test_dump_entities(tmp_path):
+    profiles = {
+        "idols": [{"id": "a", "name": "A"}, {"id": "b", "name": "B"}],
+        "groups": [{"id": "g", "name": "G", "members": []}],
+    }
+    assert dump_entities(profiles, tmp_path) == 3
+    index = json.loads((tmp_path / "index.json").read_text())
+    fpath = tmp_path / "idols" / f"a.{index['idols']['a']}.json"
+    assert json.loads(fpath.read_text()) == {"id": "a", "name": "A"}
+    gz_fpath = fpath.with_name(fpath.name + ".gz")
+    assert gzip.decompress(gz_fpath.read_bytes()) == fpath.read_bytes()
+
+    # unchanged files are kept, stale ones removed
+    profiles["idols"][1]["name"] = "Bee"
+    assert dump_entities(profiles, tmp_path) == 1
+    index = json.loads((tmp_path / "index.json").read_text())
+    names = set(f.name for f in (tmp_path / "idols").glob("*.json"))
+    assert names == set(f"{k}.{v}.json" for k, v in index["idols"].items())
+    assert not list(tmp_path.rglob("*.tmp"))
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+from .extensions import CrawlMetrics, Histogram, to_prometheus
+
+
+def test_histogram_prometheus():
+    h = Histogram()
+    for value in [0.0005, 0.002, 0.002, 0.3, 20]:
+        h.observe(value)
+    assert h.count == 5 and h.max == 20
+    metrics = {
+        "elapsed": 1.5,
+        "pages": 10,
+        "bytes": 1000,
+        "pages_per_sec_current": 2.0,
+        "bytes_per_sec_current": 200.0,
+        "queue_depth": 3,
+        "downloads_active": 1,
+        "thumbs_queue_depth": 0,
+        "callbacks": {"parse_idol": h.to_dict()},
+        "stages": {"dump": {"wall": 0.5, "cpu": 0.4}},
+    }
+    text = to_prometheus(metrics)
+    assert "kpopnet_crawl_queue_depth 3\n" in text
+    assert 'kpopnet_callback_seconds_bucket{callback="parse_idol",le="0.001"} 1' in text
+    assert 'kpopnet_callback_seconds_bucket{callback="parse_idol",le="0.005"} 3' in text
+    assert 'kpopnet_callback_seconds_bucket{callback="parse_idol",le="+Inf"} 5' in text
+    assert 'kpopnet_callback_seconds_count{callback="parse_idol"} 5' in text
+    assert 'kpopnet_stage_cpu_seconds{stage="dump"} 0.4' in text
+
+
+def test_metrics_shard_fpath(tmp_path):
+    metrics = CrawlMetrics(None, tmp_path / "metrics.json", 10.0)
+    metrics.spider_opened(SimpleNamespace(name="kastden", shard=(1, 3)))
+    metrics.task.stop()
+    assert metrics.fpath == tmp_path / "metrics.1-of-3.json"
@@ -0,0 +1,55 @@
+from scrapy import Spider
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.utils.test import get_crawler
+
+from .httpcache import SqliteCacheStorage
+
+
+def open_storage(tmp_path):
+    crawler = get_crawler(
+        Spider,
+        settings_dict={
+            "HTTPCACHE_DIR": str(tmp_path),
+            "HTTPCACHE_PRUNE": True,
+        },
+    )
+    spider = Spider("test")
+    spider.crawler = crawler
+    storage = SqliteCacheStorage(crawler.settings)
+    storage.open_spider(spider)
+    return storage, spider
+
+
+def test_store_retrieve(tmp_path):
+    storage, spider = open_storage(tmp_path)
+    page = Request("https://example.com/page")
+    image = Request("https://example.com/image.jpg")
+    body = b"<html>" + b"x" * 1000 + b"</html>"
+    storage.store_response(spider, page, HtmlResponse(page.url, body=body))
+    storage.store_response(
+        spider,
+        image,
+        Response(image.url, body=b"\xff\xd8", headers={"Content-Type": "image/jpeg"}),
+    )
+    response = storage.retrieve_response(spider, Request(page.url))
+    assert isinstance(response, HtmlResponse) and response.body == body
+    assert storage.retrieve_response(spider, Request("https://example.com/")) is None
+    rows = dict(storage.db.execute("SELECT url, compressed FROM responses"))
+    assert rows == {page.url: 1, image.url: 0}
+
+
+def test_prune(tmp_path):
+    storage, spider = open_storage(tmp_path)
+    for url in ["https://example.com/old", "https://example.com/new"]:
+        storage.store_response(spider, Request(url), Response(url, body=b"."))
+    storage.close_spider(spider)
+
+    storage, spider = open_storage(tmp_path)
+    assert storage.retrieve_response(spider, Request("https://example.com/new"))
+    spider.prune_cache = True
+    storage.close_spider(spider)
+    assert spider.crawler.stats.get_value("httpcache/pruned") == 1
+
+    storage, spider = open_storage(tmp_path)
+    assert storage.retrieve_response(spider, Request("https://example.com/old")) is None
+    assert storage.retrieve_response(spider, Request("https://example.com/new"))
@@ -0,0 +1,72 @@
+import pytest
+
+from .link import link_profiles
+
+KASTDEN = "https://selca.kastden.org/noona"
+
+
+def make_group(slug: str, debut_date: str, parent_slug=None) -> dict:
+    return {
+        "id": slug,
+        "name": slug,
+        "debut_date": debut_date,
+        "urls": [f"https://net.kpop.re/?id={slug}", f"{KASTDEN}/group/{slug}/"],
+        "parent_id": parent_slug and f"{KASTDEN}/group/{parent_slug}/",
+    }
+
+
+def make_idol(slug: str, birth_date: str, groups: list[tuple[str, bool]]) -> dict:
+    return {
+        "id": slug,
+        "real_name": slug,
+        "birth_date": birth_date,
+        "_groups": [
+            {"url": f"{KASTDEN}/group/{g}/", "current": current, "roles": None}
+            for g, current in groups
+        ],
+    }
+
+
+def test_link_profiles():
+    groups = [
+        make_group("sub2", "2015", "sub"),
+        make_group("main", "2009"),
+        make_group("sub", "2013", "main"),
+    ]
+    idols = [
+        make_idol("a", "1990", [("main", True), ("sub", True), ("sub2", True)]),
+        make_idol("b", "1991", [("sub2", True), ("sub", True), ("main", False)]),
+    ]
+    profiles = link_profiles(idols, groups)
+    assert [i["id"] for i in profiles["idols"]] == ["b", "a"]
+    assert [g["id"] for g in profiles["groups"]] == ["sub2", "sub", "main"]
+    main, sub, sub2 = profiles["groups"][::-1]
+    assert main["parent_id"] is None
+    assert sub["parent_id"] == "main"
+    assert sub2["parent_id"] == "sub"
+    assert profiles["idols"][0]["groups"] == ["sub2", "sub", "main"]
+    assert [(m["idol_id"], m["current"]) for m in sub2["members"]] == [
+        ("b", False),
+        ("a", True),
+    ]
+
+
+def test_link_profiles_order():
+    groups = [make_group("x", "2010"), make_group("y", "2010")]
+    for group in groups:
+        group["name"] = "same"
+    idols = [make_idol(slug, "1990", [("x", True)]) for slug in ["a", "c", "b"]]
+    for idol in idols:
+        idol["real_name"] = "same"
+    profiles = link_profiles(idols[::-1], groups[::-1])
+    assert [i["id"] for i in profiles["idols"]] == ["c", "b", "a"]
+    assert [g["id"] for g in profiles["groups"]] == ["y", "x"]
+
+
+def test_link_profiles_errors():
+    with pytest.raises(AssertionError, match="unknown group"):
+        link_profiles([make_idol("a", "1990", [("none", True)])], [])
+
+    groups = [make_group("x", "2010", "y"), make_group("y", "2011", "x")]
+    with pytest.raises(AssertionError, match="parent cycle"):
+        link_profiles([], groups)
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+from twisted.internet.error import TCPTimedOutError
+
+from .middlewares import AdaptiveThrottleMiddleware
+
+
+def make_throttle(max_error_rate=0.5, concurrency=2):
+    crawler = get_crawler(
+        settings_dict={
+            "ADAPTIVE_THROTTLE_ENABLED": True,
+            "ADAPTIVE_THROTTLE_TARGET_LATENCY": 1.0,
+            "ADAPTIVE_THROTTLE_MAX_ERROR_RATE": max_error_rate,
+            "ADAPTIVE_THROTTLE_MAX_CONCURRENCY": 8,
+            "ADAPTIVE_THROTTLE_MAX_DELAY": 10.0,
+            "DOWNLOAD_DELAY": 0.1,
+        }
+    )
+    slot = SimpleNamespace(concurrency=concurrency, delay=0.5)
+    downloader = SimpleNamespace(slots={"example.com": slot})
+    crawler.engine = SimpleNamespace(downloader=downloader)
+    crawler.stats = SimpleNamespace(set_value=lambda key, value: None)
+    return AdaptiveThrottleMiddleware.from_crawler(crawler), slot
+
+
+def fetch(mw, status=200, latency=0.1):
+    request = Request(
+        "https://example.com/",
+        meta={"download_slot": "example.com", "download_latency": latency},
+    )
+    mw.process_response(request, Response(request.url, status=status), None)
+
+
+def test_adaptive_throttle():
+    mw, slot = make_throttle()
+    for _ in range(2):
+        fetch(mw)
+    assert slot.concurrency == 3 and slot.delay < 0.5
+
+    fetch(mw, status=503)
+    assert slot.concurrency == 1 and slot.delay > 0.5
+    delay = slot.delay
+
+    request = Request("https://example.com/", meta={"download_slot": "example.com"})
+    mw.process_exception(request, TCPTimedOutError(), None)
+    assert slot.concurrency == 1 and slot.delay == delay * 2
+
+    for _ in range(50):
+        fetch(mw, latency=3.0)
+    # slow responses only stretch delay
+    assert 2.9 < slot.delay * slot.concurrency < 3.0
+
+
+def test_adaptive_throttle_single_error():
+    mw, slot = make_throttle(max_error_rate=0.1, concurrency=8)
+    fetch(mw, status=503)
+    assert slot.concurrency == 4 and slot.delay == 1.0
+    # error rate is above the limit for a few more responses
+    for _ in range(3):
+        fetch(mw)
+        assert slot.concurrency == 4 and slot.delay == 1.0
+    fetch(mw)
+    assert slot.concurrency == 4 and slot.delay < 1.0
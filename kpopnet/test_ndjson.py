@@ -0,0 +1,16 @@
+from .ndjson import dump_ndjson, iter_idols, read_ndjson
+
+
+def test_ndjson(tmp_path):
+    idols = [
+        {"id": "b", "name": "보람", "height": 158.0},
+        {"id": "a", "name": "A", "height": None},
+    ]
+    fpath = tmp_path / "idols.ndjson"
+    dump_ndjson(idols, fpath)
+    assert fpath.read_text().splitlines()[0] == (
+        '{"height":158.0,"id":"b","name":"보람"}'
+    )
+    assert list(read_ndjson(fpath)) == idols
+    result = iter_idols(fpath, fields=["id"], where=lambda idol: idol["height"])
+    assert list(result) == [{"id": "b"}]
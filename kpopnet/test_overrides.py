@@ -0,0 +1,49 @@
+from .items import IdolValidator
+from .overrides import OverrideIndex
+
+
+def make_idol(**kwargs) -> dict:
+    idol = {
+        "name": "BoA",
+        "name_original": "보아",
+        "real_name": "Kwon Boa",
+        "real_name_original": "권보아",
+        "birth_date": "1986-11-05",
+        "urls": ["https://selca.kastden.org/noona/idol/boa/"],
+    }
+    idol.update(kwargs)
+    return idol
+
+
+def test_override_index():
+    overrides = OverrideIndex(
+        [
+            {
+                "match": {"real_name_original": "권보아", "birth_date": "1986-11-05"},
+                "update": {"urls[2]": "https://namu.wiki/w/보아", "name_alias": "Boa"},
+            },
+            {"match": {"name_original": "보아"}, "update": {"name": "Second"}},
+            {"match": {"name_original": "없음"}, "update": {"name": "Unused"}},
+        ]
+    )
+    idol = make_idol(urls=["https://selca.kastden.org/noona/idol/boa/", "x"])
+    overrides.apply(idol)
+    # first matching override in file order wins
+    assert idol["name"] == "BoA"
+    assert idol["name_alias"] == "Boa"
+    assert idol["urls"][1] == "https://namu.wiki/w/보아"
+    assert [o["match"] for o in overrides.unmatched()] == [
+        {"name_original": "보아"},
+        {"name_original": "없음"},
+    ]
+
+
+def test_override_by_id():
+    item_id = IdolValidator.gen_id(make_idol())
+    overrides = OverrideIndex([{"match": {"id": item_id}, "update": {"weight": 45}}])
+    idol = make_idol()
+    IdolValidator.normalize(idol, overrides)
+    assert idol["id"] == item_id
+    assert idol["weight"] == 45
+    assert idol["urls"][0] == f"https://net.kpop.re/?id={item_id}"
+    assert not overrides.unmatched()
@@ -0,0 +1,65 @@
+import sys
+import subprocess
+from pathlib import Path
+
+from .search import SearchIndex, build_search, to_initials, to_jamo
+
+
+PROFILES = {
+    "idols": [
+        {
+            "id": "a",
+            "name": "Seolhyun",
+            "name_original": "설현",
+            "real_name": "Kim Seolhyun",
+            "real_name_original": "김설현",
+            "name_alias": None,
+        },
+        {
+            "id": "b",
+            "name": "Jieun",
+            "name_original": "지은",
+            "real_name": "Han Jieun",
+            "real_name_original": "한지은",
+            "name_alias": "IU, Lee Jieun",
+        },
+    ],
+    "groups": [{"id": "g", "name": "AOA", "name_original": "에이오에이"}],
+}
+
+
+def test_hangul():
+    assert to_jamo("보람") == "ㅂㅗㄹㅏㅁ"
+    assert to_initials("전보람") == "ㅈㅂㄹ"
+
+
+def test_search():
+    index = SearchIndex(build_search(PROFILES))
+    assert index.search("sulhyun") == [("idols", "a")]
+    assert index.search("ㅅㅎ") == [("idols", "a")]
+    assert index.search("서") == [("idols", "a")]
+    assert index.search("iu") == [("idols", "b")]
+    assert index.search("jiun") == [("idols", "b")]
+    assert index.search("aoa") == [("groups", "g")]
+    assert index.search("k") == [("idols", "a")]
+    assert index.search("missing") == []
+
+
+def test_dump_deterministic(tmp_path):
+    script = (
+        "import sys; from pathlib import Path;"
+        "from kpopnet.search import dump_search;"
+        "from kpopnet.test_search import PROFILES;"
+        "dump_search(PROFILES, Path(sys.argv[1]))"
+    )
+    outputs = []
+    for seed in ["1", "2"]:
+        fpath = tmp_path / f"search.{seed}.json"
+        subprocess.run(
+            [sys.executable, "-c", script, str(fpath)],
+            cwd=Path(__file__).parent / "..",
+            env={"PYTHONHASHSEED": seed},
+            check=True,
+        )
+        outputs.append(fpath.read_bytes())
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,32 @@
+from .state import CrawlState
+from .utils import page_fingerprint
+
+
+def test_page_fingerprint():
+    a = "<td>1986-03-22 (age 37) ▲ ▼</td><td>2008-04-15 (15 years ago)</td>"
+    b = "<td>1986-03-22 (age 38) ▲ ▼</td><td>2008-04-15 (16 years ago)</td>"
+    c = "<td>1986-03-23 (age 38) ▲ ▼</td><td>2008-04-15 (16 years ago)</td>"
+    assert page_fingerprint(a) == page_fingerprint(b)
+    assert page_fingerprint(a) != page_fingerprint(c)
+
+
+def test_crawl_state(tmp_path):
+    fpath = tmp_path / "state.json"
+    state = CrawlState()
+    state.add("idols", "https://x/idol/a/", "aa01", {"name": "A", "name_original": "에이"})
+    state.save(fpath)
+
+    state = CrawlState.load(fpath)
+    assert len(state) == 1
+    assert state.find("idols", "https://x/idol/a/", "aa01") == {"name": "A", "name_original": "에이"}
+    assert state.find("idols", "https://x/idol/a/", "aa02") is None
+    assert state.find("groups", "https://x/idol/a/", "aa01") is None
+
+    other = CrawlState()
+    other.add("idols", "https://x/idol/a/", "aa03", {"name": "B"})
+    other.add("groups", "https://x/group/g/", "aa04", {"name": "G"})
+    state.merge(other)
+    assert len(state) == 2
+    assert state.items("idols") == [{"name": "A", "name_original": "에이"}]
+    assert list(state.take_items("groups")) == [{"name": "G"}]
+    assert len(state) == 1
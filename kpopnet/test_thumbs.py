@@ -0,0 +1,37 @@
+import io
+import asyncio
+
+import pytest
+from PIL import Image
+
+from .thumbs import ThumbProcessor, build_all_variants
+
+
+def make_image(fmt: str) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, fmt)
+    return buf.getvalue()
+
+
+def test_thumb_processor(tmp_path):
+    thumbs = ThumbProcessor(tmp_path, 2)
+    body = make_image("JPEG")
+    fname = asyncio.run(thumbs.process(body))
+    assert (tmp_path / fname).read_bytes() == body
+    assert fname.endswith(".jpg") and fname[2] == "/"
+
+    with pytest.raises(AssertionError):
+        asyncio.run(thumbs.process(make_image("PNG")))
+    assert thumbs.pending == 0
+    thumbs.close()
+
+
+def test_build_all_variants(tmp_path):
+    fpath = tmp_path / "ab" / "cdef.jpg"
+    fpath.parent.mkdir()
+    Image.new("RGB", (300, 100)).save(fpath, "JPEG")
+    fpaths = [fpath]
+    assert build_all_variants(fpaths, [64, 256], ["jpg", "webp"], 1) == 1
+    assert Image.open(tmp_path / "ab" / "cdef.64.webp").size == (64, 21)
+    assert Image.open(tmp_path / "ab" / "cdef.256.jpg").size == (256, 85)
+    assert build_all_variants(fpaths, [64, 256], ["jpg", "webp"], 1) == 0
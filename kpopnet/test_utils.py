@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from .utils import FingerprintSet, StageTimer, parse_shard
+
+
+def test_fingerprint_set():
+    urls = [f"https://selca.kastden.org/noona/group/{n}/" for n in range(5000)]
+    s = FingerprintSet(capacity=8)
+    assert all(s.add(url) for url in urls)
+    assert not any(s.add(url) for url in urls)
+    assert len(s) == 5000 and len(s.table) == 16384
+    assert urls[0] in s and urls[0] + "x" not in s
+
+
+def test_parse_shard():
+    assert parse_shard("0/4") == (0, 4)
+    with pytest.raises(ValueError):
+        parse_shard("4/4")
+
+
+def test_stage_timer():
+    timer = StageTimer()
+    with timer("sleep"):
+        time.sleep(0.05)
+    with pytest.raises(ZeroDivisionError):
+        with timer("failed"):
+            1 / 0
+    timer.start("manual")
+    timer.stop("manual")
+    assert list(timer.stages) == ["sleep", "failed", "manual"]
+    wall, cpu = timer.stages["sleep"]
+    assert wall >= 0.05 and cpu < wall
+    assert not timer.started
@@ -0,0 +1,34 @@
+import copy
+import json
+
+from .db import DEFAULT_FPATH
+from .validate import validate_profiles
+
+
+def test_validate_profiles():
+    profiles = json.load(open(DEFAULT_FPATH))
+    assert validate_profiles(profiles).ok
+
+    idol, other_idol = profiles["idols"][:2]
+    group = next(g for g in profiles["groups"] if g["members"])
+    idol = copy.deepcopy(idol)
+    profiles["idols"][0] = idol
+    idol["birth_date"] = "1990-1-1"
+    idol["height"] = "160"
+    idol["_groups"] = []
+    del idol["weight"]
+    group["name_original"] = profiles["groups"][-1]["name_original"]
+    group["members"].append(dict(group["members"][0], idol_id=other_idol["id"]))
+    group["parent_id"] = "x" * 20
+
+    report = validate_profiles(profiles)
+    errors = set((v.kind, v.field, v.error.split(":")[0]) for v in report.violations)
+    assert errors == {
+        ("idols", "birth_date", r"doesn't match \d{4}-\d{2}-\d{2}"),
+        ("idols", "height", "expected Optional[float]"),
+        ("idols", "_groups", "unknown field"),
+        ("idols", "weight", "missing"),
+        ("groups", "name_original", "duplicate of " + group["id"]),
+        ("groups", "members", "not in groups of"),
+        ("groups", "parent_id", "unknown group"),
+    }
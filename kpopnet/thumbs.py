@@ -0,0 +1,117 @@
+import io
+import os
+import time
+import asyncio
+import hashlib
+import multiprocessing
+from pathlib import Path
+from typing import Optional
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from PIL import Image
+
+
+def write_thumb(body: bytes, out_dpath: Path) -> str:
+    """Verify, hash and store thumbnail. Returns path relative to out_dpath."""
+    im = Image.open(io.BytesIO(body))
+    assert im.format == "JPEG", im.format
+    hash = hashlib.sha1(body).hexdigest()
+    fname = hash[:2] + "/" + hash[2:] + ".jpg"
+    fpath = out_dpath / fname
+    os.makedirs(fpath.parent, exist_ok=True)
+    fpath.write_bytes(body)
+    return fname
+
+
+# Runs thumbnail processing in a thread pool so decoding, hashing and disk
+# writes don't block the reactor.
+class ThumbProcessor:
+    def __init__(self, out_dpath: Path, max_workers: int, stats=None):
+        self.out_dpath = out_dpath
+        self.stats = stats
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="thumb")
+        self.pending = 0
+
+    async def process(self, body: bytes) -> str:
+        self.pending += 1
+        self.set_stat("queue_depth", self.pending)
+        self.max_stat("queue_depth_max", self.pending)
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.pool, write_thumb, body, self.out_dpath
+            )
+        finally:
+            latency = time.perf_counter() - start
+            self.pending -= 1
+            self.set_stat("queue_depth", self.pending)
+            self.inc_stat("count")
+            self.inc_stat("latency_total", latency)
+            self.max_stat("latency_max", latency)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def set_stat(self, key: str, value):
+        if self.stats:
+            self.stats.set_value(f"thumbs/{key}", value)
+
+    def inc_stat(self, key: str, count=1):
+        if self.stats:
+            self.stats.inc_value(f"thumbs/{key}", count)
+
+    def max_stat(self, key: str, value):
+        if self.stats:
+            self.stats.max_value(f"thumbs/{key}", value)
+
+
+SAVE_OPTIONS = {
+    "jpg": {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True},
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+}
+
+
+def variant_path(fpath: Path, size: int, fmt: str) -> Path:
+    # ab/cdef.jpg -> ab/cdef.64.webp
+    return fpath.with_name(f"{fpath.stem}.{size}.{fmt}")
+
+
+def build_variants(fpath: Path, sizes: list[int], formats: list[str]):
+    """Write resized copies of thumbnail, never upscaling."""
+    with Image.open(fpath) as im:
+        im = im.convert("RGB")
+        for size in sorted(sizes, reverse=True):
+            # downscale from the previous (bigger) variant, it's much faster
+            im.thumbnail((size, size), Image.Resampling.LANCZOS)
+            for fmt in formats:
+                out_fpath = variant_path(fpath, size, fmt)
+                tmp_fpath = out_fpath.with_name(out_fpath.name + ".tmp")
+                im.save(tmp_fpath, **SAVE_OPTIONS[fmt])
+                tmp_fpath.replace(out_fpath)
+
+
+def has_variants(fpath: Path, sizes: list[int], formats: list[str]) -> bool:
+    return all(
+        variant_path(fpath, size, fmt).exists() for size in sizes for fmt in formats
+    )
+
+
+def build_all_variants(
+    fpaths: list[Path],
+    sizes: list[int],
+    formats: list[str],
+    max_workers: Optional[int] = None,
+) -> int:
+    """Build missing variants in a process pool.
+
+    Thumbnails are content-addressed, so existing variants are never rebuilt.
+    Returns number of processed originals.
+    """
+    todo = [fpath for fpath in fpaths if not has_variants(fpath, sizes, formats)]
+    if todo:
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers, mp_context=mp_context) as pool:
+            list(pool.map(build_variants, todo, repeat(sizes), repeat(formats)))
+    return len(todo)
@@ -1,5 +1,10 @@
+import re
+import time
+import hashlib
+from array import array
+from contextlib import contextmanager
 from urllib.parse import unquote
-from typing import Sequence, Mapping, Optional
+from typing import Callable, Iterator, Optional
 
 
 def unquote_no_space(url: str) -> str:
@@ -8,10 +13,129 @@ def unquote_no_space(url: str) -> str:
     return url.replace(" ", "%20")
 
 
-def find_by_field(
-    items: Sequence[Mapping], field: str, value: str
-) -> Optional[Mapping]:
-    for item in items:
-        if item[field] == value:
-            return item
-    return None
+# "(age 37)", "(15 years and 6 months ago)" etc. change without profile changes
+RELATIVE_TIME_RE = re.compile(r"\((?:age\s+\d+|[^()]*\bago)\)")
+
+
+def page_fingerprint(text: str) -> str:
+    text = RELATIVE_TIME_RE.sub("", text)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parse "I/N" shard spec (0-based index, count)."""
+    index, count = map(int, value.split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"Bad shard: {value}")
+    return index, count
+
+
+class FieldTable:
+    """Precompiled table of (label regexp, field, parser) entries.
+
+    First matching entry wins. Labels repeat across pages, so result of the
+    scan is cached per label and each distinct label is matched only once.
+    """
+
+    def __init__(self, entries: list[tuple[str, Optional[str], Callable]]):
+        self.entries = [
+            (re.compile(pattern, re.I), field, parse)
+            for pattern, field, parse in entries
+        ]
+        self.cache: dict[str, Optional[tuple[Optional[str], Callable]]] = {}
+
+    def lookup(self, label: str) -> Optional[tuple[Optional[str], Callable]]:
+        try:
+            return self.cache[label]
+        except KeyError:
+            pass
+        found = None
+        for regex, field, parse in self.entries:
+            if regex.search(label):
+                found = (field, parse)
+                break
+        self.cache[label] = found
+        return found
+
+
+class StageTimer:
+    """Wall and CPU time of pipeline stages."""
+
+    def __init__(self):
+        self.started: dict[str, tuple[float, float]] = {}
+        self.stages: dict[str, tuple[float, float]] = {}
+
+    def start(self, stage: str):
+        self.started[stage] = (time.perf_counter(), time.process_time())
+
+    def stop(self, stage: str):
+        wall, cpu = self.started.pop(stage)
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        self.stages[stage] = (wall, cpu)
+
+    @contextmanager
+    def __call__(self, stage: str) -> Iterator[None]:
+        self.start(stage)
+        try:
+            yield
+        finally:
+            self.stop(stage)
+
+
+class FingerprintSet:
+    """Set of URLs stored as 64-bit hashes in an open-addressing table.
+
+    Takes 8-16 bytes per URL regardless of URL length, instead of ~200 for a
+    set of strings. Collisions need ~4 billion URLs to become likely, unlike
+    a Bloom filter which would silently drop pages on false positives.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        assert capacity & (capacity - 1) == 0, capacity
+        # 0 marks empty slot, fingerprints are never 0
+        self.table = array("Q", bytes(8 * capacity))
+        self.mask = capacity - 1
+        self.count = 0
+
+    @staticmethod
+    def fingerprint(url: str) -> int:
+        digest = hashlib.blake2b(url.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little") or 1
+
+    def _insert(self, fp: int) -> bool:
+        table = self.table
+        i = fp & self.mask
+        while table[i]:
+            if table[i] == fp:
+                return False
+            i = (i + 1) & self.mask
+        table[i] = fp
+        return True
+
+    def add(self, url: str) -> bool:
+        """Add URL, return False if it was already present."""
+        if not self._insert(self.fingerprint(url)):
+            return False
+        self.count += 1
+        if self.count * 2 > len(self.table):
+            old = self.table
+            self.table = array("Q", bytes(16 * len(old)))
+            self.mask = len(self.table) - 1
+            for fp in old:
+                if fp:
+                    self._insert(fp)
+        return True
+
+    def __contains__(self, url: str) -> bool:
+        fp = self.fingerprint(url)
+        table = self.table
+        i = fp & self.mask
+        while table[i]:
+            if table[i] == fp:
+                return True
+            i = (i + 1) & self.mask
+        return False
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,243 @@
+"""Validation of final profiles.
+
+Checks are compiled once per schema from Idol/Group TypedDicts and rules of
+their validators. All items are checked in one pass, every violation is
+collected into a report instead of stopping on the first one.
+"""
+
+import re
+from functools import cache
+from typing import (
+    Any,
+    Callable,
+    NamedTuple,
+    Optional,
+    Union,
+    cast,
+    get_args,
+    get_origin,
+    get_type_hints,
+    is_typeddict,
+)
+
+from .items import Profiles, IdolValidator, GroupValidator, Validator
+
+# Returns error message or None
+Check = Callable[[Any], Optional[str]]
+
+
+class Violation(NamedTuple):
+    kind: str
+    id: Optional[str]
+    field: str
+    error: str
+
+
+class Report:
+    def __init__(self):
+        self.violations: list[Violation] = []
+        self.checked: dict[str, int] = {}
+
+    def add(self, kind: str, item_id: Optional[str], field: str, error: str):
+        self.violations.append(Violation(kind, item_id, field, error))
+
+    @property
+    def ok(self) -> bool:
+        return not self.violations
+
+    def to_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "checked": self.checked,
+            "violations": [v._asdict() for v in self.violations],
+        }
+
+    def __str__(self) -> str:
+        return "\n".join(
+            f"{v.kind} {v.id}: {v.field}: {v.error}" for v in self.violations
+        )
+
+
+def type_name(tp) -> str:
+    return tp.__name__ if isinstance(tp, type) else str(tp).replace("typing.", "")
+
+
+def compile_type(tp) -> Check:
+    if tp is type(None):
+        return lambda v: None if v is None else "expected null"
+    if tp is float:
+        # JSON has no separate int type
+        return lambda v: (
+            None
+            if isinstance(v, (int, float)) and not isinstance(v, bool)
+            else "expected number"
+        )
+    if tp in (str, bool, int):
+        # bool is int subclass, check exact type
+        return lambda v: None if type(v) is tp else f"expected {tp.__name__}"
+    origin = get_origin(tp)
+    if origin is Union:
+        checks = [compile_type(arg) for arg in get_args(tp)]
+        expected = f"expected {type_name(tp)}"
+        return lambda v: None if any(c(v) is None for c in checks) else expected
+
+    if origin is list:
+        check_item = compile_type(get_args(tp)[0])
+
+        def check_list(value):
+            if type(value) is not list:
+                return "expected list"
+            for n, item in enumerate(value):
+                error = check_item(item)
+                if error:
+                    return f"[{n}]: {error}"
+            return None
+
+        return check_list
+    if is_typeddict(tp):
+        schema = compile_schema(tp)
+
+        def check_dict(value):
+            if type(value) is not dict:
+                return "expected object"
+            errors = list(schema.check_fields(value))
+            return ", ".join(f"{f}: {e}" for f, e in errors) if errors else None
+
+        return check_dict
+    raise TypeError(f"Unsupported type: {tp}")
+
+
+class Schema:
+    def __init__(self, tp):
+        hints = get_type_hints(tp)
+        # keys starting with "_" are temporary, never in output
+        self.fields = set(k for k in hints if not k.startswith("_"))
+        self.checks = [(k, compile_type(hints[k])) for k in sorted(self.fields)]
+
+    def check_fields(self, item: dict):
+        """Yield (field, error) pairs."""
+        if item.keys() != self.fields:
+            for field in sorted(self.fields - item.keys()):
+                yield field, "missing"
+            for field in sorted(item.keys() - self.fields):
+                yield field, "unknown field"
+        for field, check in self.checks:
+            if field in item:
+                error = check(item[field])
+                if error:
+                    yield field, error
+
+
+@cache
+def compile_schema(tp) -> Schema:
+    return Schema(tp)
+
+
+class ItemChecker:
+    """Per-item checks of one kind of profiles."""
+
+    def __init__(self, kind: str, validator: type[Validator]):
+        self.kind = kind
+        self.schema = compile_schema(validator.SCHEMA)
+        self.required = validator.REQUIRED_FIELDS
+        self.patterns = [
+            (field, re.compile(pattern))
+            for field, pattern in validator.PATTERNS.items()
+        ]
+        self.url_patterns = [re.compile(p) for p in validator.URL_PATTERNS]
+        self.unique: dict[str, dict[Any, str]] = dict(
+            (field, {}) for field in validator.UNIQUE_FIELDS + ["id"]
+        )
+        self.validator = validator
+
+    def check(self, item: dict, report: Report):
+        item_id = item.get("id")
+        add = lambda field, error: report.add(self.kind, item_id, field, error)
+        type_errors = set()
+        for field, error in self.schema.check_fields(item):
+            type_errors.add(field)
+            add(field, error)
+        for field in self.required:
+            if field not in type_errors and not item[field]:
+                add(field, "empty")
+        for field, regex in self.patterns:
+            value = item.get(field)
+            if field not in type_errors and value is not None:
+                if not regex.fullmatch(value):
+                    add(field, f"doesn't match {regex.pattern}: {value!r}")
+        if "urls" not in type_errors:
+            self.check_urls(item, add)
+        for field, seen in self.unique.items():
+            if field in type_errors:
+                continue
+            value = item[field]
+            if value in seen:
+                add(field, f"duplicate of {seen[value]}: {value!r}")
+            else:
+                seen[value] = item_id
+
+    def check_urls(self, item: dict, add):
+        urls = item["urls"]
+        if not 2 <= len(urls) <= len(self.url_patterns):
+            add("urls", f"expected 2-{len(self.url_patterns)} urls: {urls}")
+        for url, regex in zip(urls, self.url_patterns):
+            if not regex.fullmatch(url):
+                add("urls", f"doesn't match {regex.pattern}: {url!r}")
+        if urls and item.get("id"):
+            if urls[0] != self.validator.get_kpopnet_url(item):
+                add("urls", f"first url doesn't match id: {urls[0]!r}")
+
+
+def validate_profiles(profiles: Profiles) -> Report:
+    """Check fields, types, patterns, uniqueness and references."""
+    report = Report()
+    idol_checker = ItemChecker("idols", IdolValidator)
+    group_checker = ItemChecker("groups", GroupValidator)
+    # (group id, idol id) pairs as seen from both sides
+    idol_memberships: set[tuple[str, str]] = set()
+    group_memberships: set[tuple[str, str]] = set()
+    idol_ids = set()
+    group_ids = set()
+    parents: list[tuple[str, str]] = []
+
+    for idol in profiles["idols"]:
+        idol_checker.check(cast(dict, idol), report)
+        idol_id = str(idol.get("id"))
+        idol_ids.add(idol_id)
+        for group_id in list_of(idol.get("groups"), str):
+            idol_memberships.add((group_id, idol_id))
+    for group in profiles["groups"]:
+        group_checker.check(cast(dict, group), report)
+        group_id = str(group.get("id"))
+        group_ids.add(group_id)
+        for member in list_of(group.get("members"), dict):
+            key = (group_id, str(member.get("idol_id")))
+            if key in group_memberships:
+                report.add("groups", group_id, "members", f"duplicate: {key[1]}")
+            group_memberships.add(key)
+        if group.get("parent_id"):
+            parents.append((group_id, group["parent_id"]))
+    report.checked = {
+        "idols": len(profiles["idols"]),
+        "groups": len(profiles["groups"]),
+    }
+
+    for group_id, idol_id in sorted(idol_memberships - group_memberships):
+        if group_id not in group_ids:
+            report.add("idols", idol_id, "groups", f"unknown group: {group_id}")
+        else:
+            report.add("idols", idol_id, "groups", f"not a member of: {group_id}")
+    for group_id, idol_id in sorted(group_memberships - idol_memberships):
+        if idol_id not in idol_ids:
+            report.add("groups", group_id, "members", f"unknown idol: {idol_id}")
+        else:
+            report.add("groups", group_id, "members", f"not in groups of: {idol_id}")
+    for group_id, parent_id in parents:
+        if parent_id not in group_ids:
+            report.add("groups", group_id, "parent_id", f"unknown group: {parent_id}")
+    return report
+
+
+def list_of(value, tp) -> list:
+    # wrong types are already reported, skip them here
+    return [v for v in value if type(v) is tp] if type(value) is list else []